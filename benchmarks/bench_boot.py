@@ -0,0 +1,93 @@
+# Benchmark: how long main.py takes from start to a running scheduler and to the first answered request
+# Boots main.serve_page on the host against the simulated board, in a fresh Python process each round so every
+# import is paid again, with an access point that takes --ap-ms to come up. Prints the boot steps recorded by
+# metrics.boot_mark (the same numbers the Pico logs after its first request and serves at /metrics), as the
+# median over the rounds. --json prints one line per run to keep for comparing later runs
+# Run on the host:  python benchmarks/bench_boot.py
+#                   python benchmarks/bench_boot.py --ap-ms 1500 --rounds 9 --json >> boot_times.jsonl
+# On the Pico the boot steps are at http://192.168.4.1/metrics (boot_ms line)
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Function to boot once in this process and return the boot steps {name: ms}. Run it in an empty directory
+def boot_once(ap_ms):
+    sys.path.insert(0, os.path.join(ROOT, "tools"))
+    sys.path.insert(0, os.path.join(ROOT, "piPicoCode"))
+    import asyncio
+    import main  # metrics.boot_ms starts here
+    import metrics
+    import simulator
+    main.log.level = main.log.ERROR
+    board = simulator.SimBoard(None)
+    main.controller.board = board
+
+    class SlowAccessPoint(simulator.SimAccessPoint):
+        # An access point that comes up ap_ms after it is switched on
+        def start(self, ssid, password):
+            self.up_at = time.monotonic() + ap_ms / 1000
+
+        def active(self):
+            return time.monotonic() >= self.up_at
+
+    board.ap = SlowAccessPoint()
+    real_start_server = asyncio.start_server
+    servers = []
+
+    async def local_start_server(handler, host, port):
+        server = await real_start_server(handler, "127.0.0.1", 0)
+        servers.append(server)
+        return server
+
+    async def run():
+        board.clock = simulator.SimClock(asyncio.get_running_loop())
+        asyncio.start_server = local_start_server
+        asyncio.create_task(main.serve_page())
+        while not servers:
+            await asyncio.sleep(0.001)
+        reader, writer = await asyncio.open_connection("127.0.0.1", servers[0].sockets[0].getsockname()[1])
+        writer.write(b"GET / HTTP/1.1\r\nHost: pico\r\n\r\n")
+        await reader.read()
+        writer.close()
+        while metrics.boot_steps[metrics.BOOT_FIRST_REQUEST] < 0:
+            await asyncio.sleep(0.001)
+
+    asyncio.run(run())
+    return {name: metrics.boot_steps[step] for step, name in enumerate(metrics.BOOT_STEPS)}
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Time the boot of main.py on the host")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--ap-ms", type=int, default=1000, help="ms the simulated access point takes to come up")
+    parser.add_argument("--json", action="store_true", help="print one JSON line instead of a table")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        with tempfile.TemporaryDirectory(prefix="waterv2-boot-") as workdir:
+            os.chdir(workdir)
+            print(json.dumps(boot_once(args.ap_ms)))
+            os.chdir(ROOT)
+        return
+
+    runs = []
+    for _ in range(args.rounds):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", "--ap-ms", str(args.ap_ms)],
+                             capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    median = {name: sorted(run[name] for run in runs)[len(runs) // 2] for name in runs[0]}
+    if args.json:
+        print(json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "ap_ms": args.ap_ms, "rounds": args.rounds,
+                          "median_ms": median}))
+        return
+    print(f"Boot steps, median of {args.rounds} boots, access point up after {args.ap_ms} ms (ms after main.py started)")
+    for name, ms in median.items():
+        print(f"  {name:16} {ms:6}")
+
+if __name__ == "__main__":
+    main_cli()
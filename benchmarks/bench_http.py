@@ -0,0 +1,196 @@
+# Load benchmark for the web server: requests/s, latency and dropped connections at rising concurrency
+# Starts the Pico code (main.serve_page, with the controller and web.py as on the Pico) in a separate process on
+# the simulated board, then sends a mix of GET / , POST /submit_schedule and POST /instant_test from more and more
+# clients at once, each client sending its next request as soon as the last one is answered. Every level runs
+# twice: with nothing watering, and while a zone is running (a long instant test started first).
+# For each level it prints the answered requests per second, p50/p99 latency, how many requests got 503 (busy,
+# no request buffer freed within a second, or the run queue full), and how many connections were refused, reset or timed out.
+# The results file also has the count of every status and way of failing.
+#
+#   python benchmarks/bench_http.py
+#   python benchmarks/bench_http.py --levels 1,2,4,8,16,32 --seconds 5 --json results/v1.json
+#   python benchmarks/bench_http.py --compare results/v1.json          # shows the change against an earlier run
+#   python benchmarks/bench_http.py --target 192.168.4.1:80 --levels 1,2,4   # a real Pico instead
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Share of each kind of request, and the request itself
+SCHEDULE_BODY = "&".join(f"start{i}={i + 5:02}%3A00&stop{i}={i + 5:02}%3A30" for i in range(1, 8))
+MIX = [
+    (0.5, "GET", "/", ""),
+    (0.25, "POST", "/submit_schedule", SCHEDULE_BODY),
+    (0.25, "POST", "/instant_test", "zone=1&runtime=5"),
+]
+
+# Function to run the Pico code in this process, print the port it listens on and serve until stdin closes
+# Run it in an empty directory
+def serve():
+    sys.path.insert(0, os.path.join(ROOT, "tools"))
+    sys.path.insert(0, os.path.join(ROOT, "piPicoCode"))
+    import main
+    import simulator
+    main.log.level = main.log.ERROR
+    board = simulator.SimBoard(None)
+    main.controller.board = board
+    real_start_server = asyncio.start_server
+
+    async def local_start_server(handler, host, port):
+        server = await real_start_server(handler, "127.0.0.1", 0)
+        print(server.sockets[0].getsockname()[1], flush=True)
+        return server
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        board.clock = simulator.SimClock(loop)  # on the real event loop, so the board runs in real time
+        asyncio.start_server = local_start_server
+        asyncio.create_task(main.serve_page())
+        await loop.run_in_executor(None, sys.stdin.read)  # until the benchmark closes stdin
+
+    asyncio.run(run())
+
+# Function to send one request on a new connection (the Pico closes after every answer)
+# Returns the status as a string, or what went wrong: "refused" (no connection), "reset" (the connection was
+# closed under the request), or "timeout"
+async def request(host, port, method, path, body, timeout):
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return "refused"
+    try:
+        head = f"{method} {path} HTTP/1.1\r\nHost: {host}\r\n"
+        if method == "POST":
+            head += f"Content-Type: application/x-www-form-urlencoded\r\nContent-Length: {len(body)}\r\n"
+        writer.write((head + "\r\n" + body).encode())
+        await writer.drain()
+        answer = await asyncio.wait_for(reader.read(), timeout)
+        return answer[9:12].decode() if answer.startswith(b"HTTP/") else "reset"
+    except asyncio.TimeoutError:
+        return "timeout"
+    except OSError:
+        return "reset"
+    finally:
+        writer.close()
+
+# Function to run one level: clients clients sending requests back to back for seconds
+# Returns the level's results
+async def run_level(host, port, clients, seconds, timeout):
+    latencies = []
+    outcomes = {}
+    deadline = time.perf_counter() + seconds
+
+    async def client(n):
+        i = n
+        while time.perf_counter() < deadline:
+            # Walk through the mix in the same order every run, each client starting at a different place
+            share = (i * 0.618) % 1  # spread evenly over 0..1
+            i += 1
+            for weight, method, path, body in MIX:
+                share -= weight
+                if share < 0:
+                    break
+            began = time.perf_counter()
+            status = await request(host, port, method, path, body, timeout)
+            outcomes[status] = outcomes.get(status, 0) + 1
+            if status.startswith("2"):
+                latencies.append(time.perf_counter() - began)
+
+    began = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(clients)))
+    elapsed = time.perf_counter() - began
+    latencies.sort()
+    ok = len(latencies)
+    return {
+        "clients": clients,
+        "requests": sum(outcomes.values()),
+        "ok": ok,
+        "rps": round(ok / elapsed, 1),
+        "p50_ms": round(latencies[ok // 2] * 1000, 2) if ok else None,
+        "p99_ms": round(latencies[min(ok * 99 // 100, ok - 1)] * 1000, 2) if ok else None,
+        "busy": outcomes.get("503", 0),
+        "dropped": sum(outcomes.get(name, 0) for name in ("refused", "reset", "timeout")),
+        "statuses": outcomes,
+    }
+
+async def run_benchmark(host, port, levels, seconds, timeout):
+    results = []
+    for scenario in ("idle", "zone_running"):
+        await request(host, port, "POST", "/cancel_run", "cancel_run=", timeout)
+        if scenario == "zone_running":
+            await request(host, port, "POST", "/instant_test", "zone=1&runtime=3600", timeout)
+            await asyncio.sleep(0.5)
+        for clients in levels:
+            result = await run_level(host, port, clients, seconds, timeout)
+            result["scenario"] = scenario
+            results.append(result)
+            print_result(result)
+    await request(host, port, "POST", "/cancel_run", "cancel_run=", timeout)
+    return results
+
+def print_result(result, before=None):
+    p50 = "-" if result["p50_ms"] is None else f"{result['p50_ms']:.1f}"
+    p99 = "-" if result["p99_ms"] is None else f"{result['p99_ms']:.1f}"
+    line = (f"{result['scenario']:13} {result['clients']:4} clients {result['rps']:8.1f} req/s  p50 {p50:>7} ms  "
+            f"p99 {p99:>7} ms  busy {result['busy']:5}  dropped {result['dropped']:4}")
+    if before:
+        line += f"   req/s {change(before['rps'], result['rps'])}  p99 {change(before['p99_ms'], result['p99_ms'])}"
+    print(line)
+
+def change(before, after):
+    if not before or after is None:
+        return "   -  "
+    return f"{(after - before) / before * 100:+5.0f}%"
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Load benchmark for the waterv2 web server")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="comma separated numbers of clients at once")
+    parser.add_argument("--seconds", type=float, default=3, help="seconds to run each level for")
+    parser.add_argument("--timeout", type=float, default=5, help="seconds to wait for a connection or an answer")
+    parser.add_argument("--target", help="host:port of a running server (a Pico) instead of starting one here")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results file of an earlier run to compare against")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        with tempfile.TemporaryDirectory(prefix="waterv2-http-") as workdir:
+            os.chdir(workdir)
+            serve()
+            os.chdir(ROOT)
+        return
+
+    levels = [int(n) for n in args.levels.split(",")]
+    server = None
+    if args.target:
+        host, _, port = args.target.partition(":")
+        port = int(port or 80)
+    else:
+        server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve"], stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE, text=True)
+        host, port = "127.0.0.1", int(server.stdout.readline())
+    try:
+        results = asyncio.run(run_benchmark(host, port, levels, args.seconds, args.timeout))
+    finally:
+        if server is not None:
+            server.stdin.close()
+            server.wait(10)
+
+    if args.compare:
+        with open(args.compare) as f:
+            earlier = {(r["scenario"], r["clients"]): r for r in json.load(f)["results"]}
+        print(f"Against {args.compare}:")
+        for result in results:
+            print_result(result, earlier.get((result["scenario"], result["clients"])))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "target": args.target or "simulated",
+                       "seconds": args.seconds, "results": results}, f, indent=1)
+
+if __name__ == "__main__":
+    main_cli()
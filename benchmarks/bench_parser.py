@@ -0,0 +1,80 @@
+# Allocation and timing benchmark: the single pass request parser against the old split() based parse_request
+# Run on the host:  python benchmarks/bench_parser.py
+# Run on the Pico:  mpremote cp piPicoCode/request_parser.py : + run benchmarks/bench_parser.py
+import sys
+import time
+import gc
+
+sys.path.insert(0, "piPicoCode")
+from request_parser import find_head_end, parse_form
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  # MicroPython, use gc.mem_alloc() instead
+
+ROUNDS = 200
+
+# The parser as it was before (decodes the whole request and rescans the body for every field)
+def legacy_manual_url_decode(encoded_str):
+    decode_map = {"%3A": ":", "%2F": "/", "%20": " ", "%3D": "=", "%26": "&", "%2C": ",", "%2E": "."}
+    for encoded, decoded in decode_map.items():
+        encoded_str = encoded_str.replace(encoded, decoded)
+    return encoded_str
+
+def legacy_parse_request(request):
+    request = request.decode("utf-8")
+    body = request.split("\r\n\r\n")[1]
+    data = {}
+    if "new_time=" in body:
+        data["new_time"] = body.split("new_time=")[1].split("&")[0]
+    for i in range(1, 8):
+        start_time = body.split(f"start{i}=")[1].split("&")[0] if f"start{i}=" in body else "NULL"
+        stop_time = body.split(f"stop{i}=")[1].split("&")[0] if f"stop{i}=" in body else "NULL"
+        data[f"row{i}"] = {"start": legacy_manual_url_decode(start_time), "stop": legacy_manual_url_decode(stop_time)}
+    if "zone=" in body and "runtime=" in body:
+        data["instant_test"] = {"zone": body.split("zone=")[1].split("&")[0], "runtime": body.split("runtime=")[1].split("&")[0]}
+    return data
+
+def new_parse_request(request):
+    head_end = find_head_end(request, 0, len(request))
+    return parse_form(memoryview(request)[head_end:])
+
+def make_request():
+    body = "&".join(f"start{i}=0{i}%3A00&stop{i}=0{i}%3A30" for i in range(1, 8)) + "&submit_schedule="
+    return (f"POST /submit_schedule HTTP/1.1\r\nHost: 192.168.4.1\r\nContent-Type: application/x-www-form-urlencoded\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n{body}").encode()
+
+def ticks():
+    if hasattr(time, "ticks_us"):
+        return time.ticks_us()
+    return time.perf_counter_ns() // 1000
+
+def allocated_by(parse, request):
+    gc.collect()
+    if tracemalloc:
+        tracemalloc.start()
+        parse(request)
+        allocated = tracemalloc.get_traced_memory()[1]  # peak while parsing
+        tracemalloc.stop()
+        return allocated
+    gc.disable()
+    before = gc.mem_alloc()
+    parse(request)
+    allocated = gc.mem_alloc() - before
+    gc.enable()
+    return allocated
+
+def measure(name, parse, request):
+    parse(request)  # warm up
+    gc.collect()
+    start = ticks()
+    for _ in range(ROUNDS):
+        parse(request)
+    elapsed = ticks() - start
+    print(f"{name:8} {elapsed / ROUNDS:10.1f} us/parse {allocated_by(parse, request):8} bytes allocated/parse")
+
+request = make_request()
+print(f"{len(request)} byte request, {ROUNDS} rounds")
+measure("legacy", legacy_parse_request, request)
+measure("new", new_parse_request, request)
@@ -0,0 +1,70 @@
+# Benchmark: loading and saving the schedule as schedule.txt text against the binary schedule.bin
+# Run on the host:  python benchmarks/bench_store.py
+# Run on the Pico:  mpremote cp piPicoCode/windows.py piPicoCode/schedule_store.py : + run benchmarks/bench_store.py
+import sys
+import os
+import time
+
+sys.path.insert(0, "piPicoCode")
+import schedule_store
+from schedule_store import load_schedule, save_schedule, read_text_schedule
+from windows import ALL_DAYS, window_minutes
+
+ROUNDS = 50
+
+# The text format as it was written before: one comma separated line per window
+def legacy_save(windows):
+    with open("bench_schedule.txt", "w") as f:
+        for zone, start, stop, days in windows:
+            f.write(f"row{zone}, {start // 60}, {start % 60}, {stop // 60}, {stop % 60}, {window_minutes(start, stop)}, {days}\n")
+
+def legacy_load():
+    return read_text_schedule("bench_schedule.txt")
+
+def binary_save(windows):
+    schedule_store.saved_windows = None  # force a write every round
+    save_schedule(windows)
+
+def binary_load():
+    schedule_store.saved_windows = None
+    return load_schedule()
+
+def ticks():
+    if hasattr(time, "ticks_us"):
+        return time.ticks_us()
+    return time.perf_counter_ns() // 1000
+
+def measure(action, *args):
+    start = ticks()
+    for _ in range(ROUNDS):
+        action(*args)
+    return (ticks() - start) / ROUNDS
+
+workdir = None
+if hasattr(os, "makedirs"):
+    import tempfile
+    workdir = tempfile.TemporaryDirectory(prefix="waterv2-store-")  # keep the host run out of the repo
+    old_cwd = os.getcwd()
+    os.chdir(workdir.name)
+# Files of the benchmark's own, so a run on the Pico never overwrites or removes the live schedule
+schedule_store.SCHEDULE_FILE = "bench_schedule.bin"
+schedule_store.TEMP_FILE = "bench_schedule.tmp"
+schedule_store.TEXT_FILE = "bench_schedule.txt"
+
+print(f"{'windows':>8} {'text save':>10} {'bin save':>10} {'text load':>10} {'bin load':>10} {'text B':>7} {'bin B':>6}  (us)")
+for n in (7, 21, 49):
+    windows = [(i % 7 + 1, i * 10, i * 10 + 5, ALL_DAYS) for i in range(n)]
+    text_save = measure(legacy_save, windows)
+    bin_save = measure(binary_save, windows)
+    text_load = measure(legacy_load)
+    bin_load = measure(binary_load)
+    assert legacy_load() == binary_load() == windows
+    text_size = os.stat("bench_schedule.txt")[6]
+    bin_size = os.stat(schedule_store.SCHEDULE_FILE)[6]
+    print(f"{n:8} {text_save:10.1f} {bin_save:10.1f} {text_load:10.1f} {bin_load:10.1f} {text_size:7} {bin_size:6}")
+
+os.remove("bench_schedule.txt")
+os.remove(schedule_store.SCHEDULE_FILE)
+if workdir is not None:
+    os.chdir(old_cwd)
+    workdir.cleanup()
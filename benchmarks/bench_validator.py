@@ -0,0 +1,78 @@
+# Benchmark: sweep line schedule validator against the old pairwise check_for_overlap, on large synthetic schedules
+# Run on the host:  python benchmarks/bench_validator.py
+# Run on the Pico:  mpremote cp piPicoCode/windows.py : + run benchmarks/bench_validator.py
+import sys
+import time
+
+sys.path.insert(0, "piPicoCode")
+from windows import ALL_DAYS, time_to_minutes, find_conflicts
+
+# The validator as it was before: every pair of windows, four URL decodes and conversions per pair
+def legacy_manual_url_decode(encoded_str):
+    decode_map = {"%3A": ":", "%2F": "/", "%20": " ", "%3D": "=", "%26": "&", "%2C": ",", "%2E": "."}
+    for encoded, decoded in decode_map.items():
+        encoded_str = encoded_str.replace(encoded, decoded)
+    return encoded_str
+
+def legacy_convert_to_minutes(time_str):
+    time_str = legacy_manual_url_decode(time_str)
+    hours, minutes = map(int, time_str.split(":"))
+    return hours * 60 + minutes
+
+def legacy_check_for_overlap(data):
+    time_windows = []
+    for row, times in data.items():
+        if times['start'] != "NULL" and times['stop'] != "NULL":
+            time_windows.append((times['start'], times['stop']))
+    for i, (start1, stop1) in enumerate(time_windows):
+        for j, (start2, stop2) in enumerate(time_windows):
+            if i != j:
+                start1_minutes = legacy_convert_to_minutes(start1)
+                stop1_minutes = legacy_convert_to_minutes(stop1)
+                start2_minutes = legacy_convert_to_minutes(start2)
+                stop2_minutes = legacy_convert_to_minutes(stop2)
+                if (start1_minutes < stop2_minutes) and (start2_minutes < stop1_minutes):
+                    return True
+    return False
+
+# The new path: convert every time once, then one sorted sweep
+def new_check_for_overlap(data):
+    windows = []
+    for row, times in data.items():
+        if times['start'] != "NULL" and times['stop'] != "NULL":
+            windows.append((int(row[3:]), time_to_minutes(times['start']), time_to_minutes(times['stop']), ALL_DAYS))
+    return find_conflicts(windows)
+
+# A schedule of n back to back 5 minute windows with no overlap, the worst case for the pairwise check
+# The old code got times still URL encoded ("07%3A00"), the new code gets them decoded by the request parser
+def make_schedule(n, colon):
+    data = {}
+    for i in range(n):
+        start = i * 5
+        stop = start + 5
+        data[f"row{i + 1}"] = {"start": f"{start // 60:02}{colon}{start % 60:02}", "stop": f"{stop // 60:02}{colon}{stop % 60:02}"}
+    return data
+
+def ticks():
+    if hasattr(time, "ticks_us"):
+        return time.ticks_us()
+    return time.perf_counter_ns() // 1000
+
+def measure(check, data):
+    rounds = 0
+    start = ticks()
+    while True:
+        check(data)
+        rounds += 1
+        elapsed = ticks() - start
+        if elapsed > 200000:
+            return elapsed / rounds
+
+print(f"{'windows':>8} {'legacy us':>12} {'sweep us':>10} {'speedup':>8}")
+for n in (7, 21, 49, 98, 196):
+    encoded = make_schedule(n, "%3A")
+    decoded = make_schedule(n, ":")
+    assert not legacy_check_for_overlap(encoded) and not new_check_for_overlap(decoded)
+    legacy = measure(legacy_check_for_overlap, encoded)
+    new = measure(new_check_for_overlap, decoded)
+    print(f"{n:8} {legacy:12.1f} {new:10.1f} {legacy / new:7.1f}x")
@@ -0,0 +1,520 @@
+# Controller: the schedule, the run queue and the zone runner that drives the pump and selector
+# Loaded first at boot (see main.py), so the scheduler is running before the web server (web.py) is even imported.
+# Everything runs as asyncio tasks on core 0, or in core1_worker on core 1 in dual-core mode
+import _thread
+import asyncio
+import hal
+import heapq
+import log
+import metrics
+import run_history
+import schedule_store
+from array import array
+from hal import ticks_diff
+from windows import MINUTES_PER_DAY, MINUTES_PER_WEEK, time_to_minutes, window_minutes
+from schedule_store import load_schedule
+from run_queue import PRIORITY_TEST, PRIORITY_SCHEDULE, PRIORITY_NAMES, MAX_QUEUED_RUNS, RunJob, RunQueue, merge_runs
+from duty_cycle import MIN_PULSE_SECONDS, PumpBudget
+from mailbox import (Mailbox, CMD_RUN, CMD_CANCEL, CMD_SCHEDULE, CMD_CLOCK, CMD_STOP, COMMAND_FIELDS,
+                     STATUS_FIELDS, STATUS_RUNNING, STATUS_QUEUED, STATUS_DONE)
+
+# The hardware: pump, zone selector, clock and access point (see hal.py). Set up when main.py starts,
+# or by tools/simulator.py with a simulated board
+board = None
+# Commands and status between the cores in dual-core mode (see mailbox.py), None when everything runs on core 0
+mailbox = None
+
+# Zone runs waiting for the zone runner to pick them up (see run_queue.py)
+run_queue = RunQueue()
+# Job the zone runner is on, and the zone it is watering (0 = nothing running)
+active_job = None
+active_zone = 0
+# Last few runs that finished, newest first, for the status page
+recent_runs = []
+RECENT_RUNS = 5
+# Goes up whenever a run is queued, started or stopped, and the clock time (whole seconds) it last did
+runs_version = 0
+runs_modified = 0
+# Thermal budget the pump waters within (see duty_cycle.py)
+pump_budget = PumpBudget()
+# Set whenever a new run is queued or stopped so the zone runner task wakes up
+run_requested = asyncio.Event()
+# Seconds the selector waits at a zone after a run before going back to zone 0
+SELECTOR_PARK_DELAY = 30
+# Break after the pump stops, not to overload the power supply
+POWER_BREAK_MS = 200
+
+# What the zone runner is doing (see runner_step)
+RUNNER_IDLE = 0       # nothing to do, the arm parks at zone 0 after SELECTOR_PARK_DELAY
+RUNNER_PREPARING = 1  # the arm moves to the active job's zone while the pump cools down
+RUNNER_PUMPING = 2
+RUNNER_BREAK = 3      # the pump just stopped or the arm is parking, nothing starts until runner_until
+runner_state = RUNNER_IDLE
+# Ticks the current state lasts until, when the runner last went idle and when the pump was switched on
+runner_until = 0
+idle_since = 0
+pulse_began = 0
+
+# Every schedule window as (zone, start minute of day, stop minute of day, days), as saved in schedule.bin
+schedule_windows = []
+
+# Weekly schedule calendar: one byte per minute of the week (Monday 00:00 first) holding the zone
+# that waters in that minute (0 = none). CALENDAR_START is or'ed in on the first minute of a window.
+# Compiled from the schedule at boot and whenever the schedule is written, so checks never touch flash
+CALENDAR_START = 0x80
+calendar = bytearray(MINUTES_PER_WEEK)
+# Minute of the week of every window start in the calendar
+schedule_starts = []
+# Goes up every time the calendar is rebuilt, so anything cached from the schedule knows it is stale
+schedule_version = 0
+# Clock time the schedule was loaded or last saved, the Last-Modified of /api/schedule
+schedule_modified = 0
+
+# Scheduler: the next start of every window as (deadline in clock seconds, minute of week), earliest first
+schedule_heap = []
+# Deadline each window start last fired at, so a start never fires twice
+last_fired = {}
+# Starts missed by up to this many seconds (a slow request, or the clock set forward past them) still run
+CATCH_UP_SECONDS = 120
+# Longest the scheduler sleeps in one go before it looks at the clock again
+MAX_SCHEDULER_SLEEP = 3600
+SECONDS_PER_WEEK = MINUTES_PER_WEEK * 60
+# Set when the schedule or the clock changes so the scheduler plans again
+schedule_changed = asyncio.Event()
+
+# Function to handle setting the system time
+async def set_system_time(new_time):
+    # Sets the RTC - this is so we can reset system time when not network connected
+    if new_time:
+        # Extract hour and minute from new_time (e.g., "12:34"). A bad time raises ValueError, a 400 for the client
+        hours, minutes = divmod(time_to_minutes(new_time), 60)
+
+        # Set the system time to a fixed date and the parsed time
+        board.clock.set_time(hours, minutes)
+        log.info(f"Changing system time to: {new_time}")
+        # every planned deadline moved
+        if mailbox is not None:
+            if not await mailbox.post_async(CMD_CLOCK):
+                log.error("Core 1 is not taking commands, schedule not replanned")
+        else:
+            schedule_changed.set()
+
+def turn_on_city_supply(time_in_seconds):
+  solenoid.duty_u16(65535) #turn on city supply. 
+  sleep(time_in_seconds)
+  pwm.duty_u16(0) #turn off city supply
+  sleep(0.5)
+
+# Function to queue a zone run from the web server. Returns None if the queue is full
+# Everything runs on core 0: returns the job (see queue_zone_run). Dual-core mode: posts the run to core 1 and returns True
+def start_zone_run(zone, time_in_seconds, priority=PRIORITY_TEST, deadline=None):
+    zone = int(zone)
+    time_in_seconds = int(time_in_seconds)
+    if not 1 <= zone < len(hal.ZONE_NS) or time_in_seconds <= 0:
+        raise ValueError(f"Bad zone run: zone {zone} for {time_in_seconds} seconds")
+    if mailbox is not None:
+        until_deadline = -1 if deadline is None else deadline - board.clock.time()
+        return mailbox.post(CMD_RUN, zone, time_in_seconds, priority, until_deadline) or None
+    return queue_zone_run(zone, time_in_seconds, priority, deadline)
+
+# Function to stop the running zone and empty the run queue, from the web server
+async def cancel_zone_run():
+    if mailbox is not None:
+        if not await mailbox.post_async(CMD_CANCEL):
+            log.error("Core 1 is not taking commands, run not cancelled")
+    else:
+        stop_zone_runs()
+
+# Function to note that a run was queued, started or stopped, for the ETag and Last-Modified of /api/status
+def runs_changed():
+    global runs_version, runs_modified
+    runs_version += 1
+    runs_modified = int(board.clock.time())
+
+# Function to put a zone run in the queue. Returns the job the run ended up in, None if the queue is full
+# A run for the zone that is watering right now just makes it water longer, and a run with a more urgent
+# priority preempts the running one, which goes back in the queue with the time it had left
+def queue_zone_run(zone, time_in_seconds, priority, deadline):
+    job = RunJob(zone, time_in_seconds, priority, board.clock.time(), deadline)
+    if active_zone == zone and active_job.priority == priority:
+        merge_runs(active_job, job)
+        runs_changed()
+        return active_job
+    job = run_queue.add(job)
+    if job is None:
+        log.warning(f"Run queue full, zone {zone} not queued")
+        return None
+    runs_changed()
+    if active_job is not None and priority < active_job.priority:
+        log.info(f"Zone {active_job.zone} preempted")
+        stop_job(board.clock.ticks_ms())
+    run_requested.set()
+    return job
+
+# Function to stop the running zone and empty the run queue
+def stop_zone_runs():
+    for job in run_queue.jobs:
+        if job.started is not None:
+            finish_job(job)  # watered a pulse or more before it was cancelled
+    run_queue.clear()
+    if active_job is not None:
+        active_job.seconds = 0  # so it doesn't go back in the queue
+        stop_job(board.clock.ticks_ms())
+        log.info("Zone run cancelled")
+    runs_changed()
+    run_requested.set()
+
+# Function to stop the active job: the pump goes off, and the job goes back in the queue if it has time left
+def stop_job(now):
+    global active_job, active_zone, runner_state, runner_until
+    job = active_job
+    if job.step_began is not None:
+        job.seconds -= ticks_diff(now, job.step_began) / 1000
+        job.step_began = None
+    board.pump.off() #turn off the pump
+    if pump_budget.running:
+        pump_budget.switch(False, now)
+        job.last_pulse = board.clock.time()
+        job.pumped += ticks_diff(now, pulse_began) / 1000
+        metrics.pump_seconds[job.zone] += round(ticks_diff(now, pulse_began) / 1000)
+    if job.seconds > 0:
+        # Back in the queue for its next pulse (or after the run that preempted it)
+        if run_queue.add(job) is None:
+            log.warning(f"Run queue full, zone {job.zone} dropped")
+    else:
+        finish_job(job)
+    active_job = None
+    active_zone = 0
+    runs_changed()
+    runner_state = RUNNER_BREAK
+    runner_until = now + POWER_BREAK_MS
+
+# Function to note a job as finished: it goes to the recent runs and, if the pump ran on it, the run history
+def finish_job(job):
+    job.finished = board.clock.time()
+    recent_runs.insert(0, job)
+    del recent_runs[RECENT_RUNS:]
+    if job.started is not None and round(job.pumped) > 0:
+        run_history.add(job.zone, job.started, round(job.pumped), job.priority, job.finished)
+
+# Function to take the next job from the queue and send the arm to its zone. Returns False if the queue is empty
+def start_next_job(now):
+    global active_job, active_zone, runner_state, runner_until
+    # While the pump has to cool anyway the arm can travel for free, so the queued zones take turns
+    queued = len(run_queue.jobs)
+    # Jobs that already watered a pulse, in case next_job drops them because their window ended
+    started = [job for job in run_queue.jobs if job.started is not None] if queued else None
+    job = run_queue.next_job(board.selector.position, board.clock.time(), pump_budget.rest_needed(now),
+                             max(pump_budget.allowance(now), MIN_PULSE_SECONDS))
+    if started:
+        for dropped in started:
+            if dropped is not job and dropped not in run_queue.jobs:
+                finish_job(dropped)
+    if job is None:
+        if queued:
+            runs_changed()  # the runs left were past the end of their windows and dropped
+        return False
+    runs_changed()
+    log.debug(f"Running zone {job.zone}, {job.seconds:.0f} seconds to go ({PRIORITY_NAMES[job.priority]})")
+    active_job = job
+    active_zone = job.zone
+    rest = pump_budget.rest_needed(now, min(job.seconds, MIN_PULSE_SECONDS))
+    #set the servo to that zone while the pump cools down, wait for whichever takes longer
+    travel = board.selector.move_to(job.zone)
+    runner_until = board.clock.ticks_ms() + int(max(travel, rest) * 1000) + 1 #timed from when the arm really set off
+    runner_state = RUNNER_PREPARING
+    return True
+
+# Function to move the zone runner on: switches the pump and selector for whatever is due at ticks now.
+# Jobs are watered a pulse at a time, each pulse as long as the pump's thermal budget allows (see duty_cycle.py)
+# Returns how many ms until it needs to run again, or None if nothing happens until a run is queued
+def runner_step(now):
+    global runner_state, runner_until, idle_since, pulse_began
+    while True:
+        if runner_state == RUNNER_BREAK:
+            if ticks_diff(runner_until, now) > 0:
+                return ticks_diff(runner_until, now)
+            runner_state = RUNNER_IDLE
+            idle_since = now
+
+        if runner_state == RUNNER_IDLE:
+            if start_next_job(now):
+                continue
+            if board.selector.position == 0:
+                return None
+            # Park the arm at zone 0 (all zones off) once no run has come in for a while.
+            # Back to back runs skip this and go straight from one zone to the next
+            park_in = SELECTOR_PARK_DELAY * 1000 - ticks_diff(now, idle_since)
+            if park_in > 0:
+                return park_in
+            travel = board.selector.move_to(0)
+            runner_until = board.clock.ticks_ms() + int(travel * 1000) + 1
+            runner_state = RUNNER_BREAK
+            continue
+
+        if runner_state == RUNNER_PREPARING:
+            if ticks_diff(runner_until, now) > 0:
+                return ticks_diff(runner_until, now)
+            runner_state = RUNNER_PUMPING
+
+        job = active_job
+        if job.step_began is not None:
+            if ticks_diff(runner_until, now) > 0:
+                return ticks_diff(runner_until, now)
+            job.seconds -= ticks_diff(now, job.step_began) / 1000
+            job.step_began = None
+        if job.deadline is not None:
+            job.seconds = min(job.seconds, job.deadline - board.clock.time()) #scheduled runs stop when their window ends
+            if not pump_budget.running and job.seconds < MIN_PULSE_SECONDS:
+                job.seconds = 0 #not worth starting the pump for what is left of the window
+        step = min(job.seconds, pump_budget.allowance(now))
+        if job.seconds <= 0 or step < min(job.seconds, 1):
+            stop_job(now) #done, or the pump is at its limit and the job goes back in the queue for another pulse
+            continue
+        if not pump_budget.running:
+            board.pump.on() #turn on the pump
+            pump_budget.switch(True, now)
+            pulse_began = now
+            if job.started is None:
+                job.started = board.clock.time()
+                runs_changed()
+        job.step_began = now  #more time can be merged into the job while it runs, so it is checked again after the step
+        runner_until = now + int(step * 1000) + 1
+        return ticks_diff(runner_until, now)
+
+# Zone runner task: the only place the pump and selector are driven when everything runs on core 0
+async def zone_runner():
+    try:
+        while True:
+            run_requested.clear()
+            wait = runner_step(board.clock.ticks_ms())
+            if wait is None:
+                await run_requested.wait()
+            else:
+                try:
+                    await asyncio.wait_for(run_requested.wait(), wait / 1000)
+                except asyncio.TimeoutError:
+                    pass
+    finally:
+        board.pump.off()  # never leave the pump on, also when the task is cancelled
+
+# Function to tell whether the zone runner has nothing to do until a run is queued: nothing watering or queued
+# and the arm parked at zone 0 (see power.py)
+def runner_idle():
+    return runner_state == RUNNER_IDLE and active_job is None and not run_queue.jobs and board.selector.position == 0
+
+# Status rows in the mailbox layout (see mailbox.py): the running job, the queue and the last few runs
+STATUS_ROWS = 1 + MAX_QUEUED_RUNS + RECENT_RUNS
+status_rows = array("l", [0] * (STATUS_ROWS * STATUS_FIELDS))
+# runs_version and runs_modified as of status_rows
+status_info = array("l", [0, 0])
+
+# Function to write one run into status row row of out. Returns the next row
+def put_status_row(out, row, state, job, now):
+    left = job.seconds
+    if job.step_began is not None:
+        left -= ticks_diff(board.clock.ticks_ms(), job.step_began) / 1000
+    i = row * STATUS_FIELDS
+    out[i] = state
+    out[i + 1] = job.zone
+    out[i + 2] = max(int(left), 0)
+    out[i + 3] = job.priority
+    out[i + 4] = job.merged
+    out[i + 5] = int(now - job.queued)
+    out[i + 6] = -1 if job.started is None else int(now - job.started)
+    out[i + 7] = -1 if job.finished is None else int(now - job.finished)
+    return row + 1
+
+# Function to fill out with the status of the zone runner. Returns the number of rows
+def fill_status(out):
+    now = board.clock.time()
+    rows = 0
+    if active_job is not None:
+        rows = put_status_row(out, rows, STATUS_RUNNING, active_job, now)
+    for job in run_queue.jobs[:MAX_QUEUED_RUNS]:
+        rows = put_status_row(out, rows, STATUS_QUEUED, job, now)
+    for job in recent_runs:
+        rows = put_status_row(out, rows, STATUS_DONE, job, now)
+    return rows
+
+# Function to get the zone runner status into status_rows and status_info, from core 1 in dual-core mode.
+# Returns the number of rows
+def read_status():
+    if mailbox is not None:
+        return mailbox.read_status(status_rows, status_info)
+    status_info[0] = runs_version
+    status_info[1] = runs_modified
+    return fill_status(status_rows)
+
+# Core 1 polls the mailbox at least this often in dual-core mode
+CORE1_POLL_MS = 50
+
+# Core 1 loop in dual-core mode: owns the pump and selector, runs the schedule and the zone runner,
+# and takes commands from the web server on core 0 through the mailbox
+def core1_worker():
+    command = array("l", [0] * COMMAND_FIELDS)
+    status = array("l", [0] * (STATUS_ROWS * STATUS_FIELDS))
+    try:
+        while True:
+            while mailbox.take(command):
+                op = command[0]
+                if op == CMD_RUN:
+                    deadline = None if command[4] < 0 else board.clock.time() + command[4]
+                    queue_zone_run(command[1], command[2], command[3], deadline)
+                elif op == CMD_CANCEL:
+                    stop_zone_runs()
+                elif op == CMD_SCHEDULE:
+                    build_calendar(list(schedule_store.saved_windows))
+                elif op == CMD_CLOCK:
+                    schedule_changed.set()
+                elif op == CMD_STOP:
+                    return
+            if schedule_changed.is_set():
+                schedule_changed.clear()
+                plan_schedule()
+            check_schedule()
+            metrics.boot_mark(metrics.BOOT_SCHEDULER)
+            wait = runner_step(board.clock.ticks_ms())
+            mailbox.publish(status, fill_status(status), runs_version, runs_modified)
+            board.clock.sleep_ms(CORE1_POLL_MS if wait is None else max(min(wait, CORE1_POLL_MS), 1))
+    finally:
+        board.pump.off()  # never leave the pump on
+
+# Schedule task: sleeps until the next window start (or until the schedule or clock changes) and fires it
+async def schedule_runner():
+    while True:
+        if schedule_changed.is_set():
+            schedule_changed.clear()
+            plan_schedule()
+        wait = check_schedule()
+        metrics.boot_mark(metrics.BOOT_SCHEDULER)
+        try:
+            await asyncio.wait_for(schedule_changed.wait(), wait)
+        except asyncio.TimeoutError:
+            pass
+
+# How often the history task looks for finished runs to write to flash. Checked rather than signalled, as in
+# dual-core mode the runs are added on core 1
+HISTORY_CHECK_S = 300
+
+# History task: writes finished runs to flash in batches (see run_history.py). Always runs on core 0, so in
+# dual-core mode core 1 never writes to flash while core 0 does
+async def history_writer():
+    while True:
+        await asyncio.sleep(HISTORY_CHECK_S)
+        if run_history.flush_due(board.clock.time()):
+            run_history.flush()
+
+# Function to load the schedule and start the zone runner and scheduler tasks
+# Everything except the web server, so tools/simulator.py can run it on its own
+def start_controller(dual_core=False):
+    global mailbox, schedule_modified
+    # Load the schedule (migrating schedule.txt or creating the default one if necessary)
+    build_calendar(load_schedule())
+    schedule_modified = board.clock.time()
+    run_history.load()
+    asyncio.create_task(history_writer())
+
+    if dual_core:
+        # The pump and the schedule run on core 1, the web server keeps core 0 to itself
+        mailbox = Mailbox(STATUS_ROWS)
+        _thread.start_new_thread(core1_worker, ())
+        log.info("Pump and schedule running on core 1")
+    else:
+        # The pump and the schedule run in their own tasks, next to the web server
+        asyncio.create_task(zone_runner())
+        asyncio.create_task(schedule_runner())
+
+# Function to compile the schedule windows into the weekly calendar
+def build_calendar(windows):
+    global schedule_windows, schedule_version
+    schedule_windows = windows
+    for i in range(MINUTES_PER_WEEK):
+        calendar[i] = 0
+    schedule_starts.clear()
+    for zone, start, stop, days in windows:
+        length = window_minutes(start, stop)  # windows that cross midnight run on into the next day
+        if length == 0:
+            continue
+        for day in range(7):
+            if days & (1 << day):
+                first = day * MINUTES_PER_DAY + start
+                for minute in range(first, first + length):
+                    calendar[minute % MINUTES_PER_WEEK] = zone
+                calendar[first] = zone | CALENDAR_START
+    for minute in range(MINUTES_PER_WEEK):
+        if calendar[minute] & CALENDAR_START:
+            schedule_starts.append(minute)
+    log.info(f"Schedule calendar built from {len(windows)} windows")
+    schedule_version += 1
+    schedule_changed.set()
+
+# Function to turn a localtime() tuple into the minute of the week used to index the calendar
+def minute_of_week(current_time):
+    return current_time[6] * MINUTES_PER_DAY + current_time[3] * 60 + current_time[4]
+
+# Function to return the zone that should be watering at the given minute of the week (0 = none)
+def zone_on_at(week_minute):
+    return calendar[week_minute] & ~CALENDAR_START
+
+# Function to return how many minutes the window starting at week_minute lasts
+def window_length(week_minute):
+    zone = zone_on_at(week_minute)
+    length = 1
+    while length < MINUTES_PER_WEEK:
+        slot = calendar[(week_minute + length) % MINUTES_PER_WEEK]
+        if slot != zone:  # a different zone, nothing, or the start of the zone's next window
+            break
+        length += 1
+    return length
+
+# Function to work out when the current week started (Monday 00:00) in clock seconds
+def week_start_seconds(now):
+    current_time = board.clock.localtime(now)
+    return now - minute_of_week(current_time) * 60 - current_time[5]
+
+# Function to rebuild the scheduler heap with the next deadline of every window start.
+# Starts that passed less than CATCH_UP_SECONDS ago are kept so they still get a chance to run
+def plan_schedule():
+    now = board.clock.time()
+    week_start = week_start_seconds(now)
+    schedule_heap.clear()
+    for week_minute in schedule_starts:
+        deadline = week_start + week_minute * 60
+        if deadline < now - CATCH_UP_SECONDS:
+            deadline += SECONDS_PER_WEEK
+        schedule_heap.append((deadline, week_minute))
+    heapq.heapify(schedule_heap)
+    # forget starts that are no longer in the schedule
+    for week_minute in list(last_fired):
+        if not calendar[week_minute] & CALENDAR_START:
+            del last_fired[week_minute]
+
+# Function to start every window whose deadline has passed. Returns the seconds until the next deadline
+def check_schedule():
+    now = board.clock.time()
+    while schedule_heap and schedule_heap[0][0] <= now:
+        deadline, week_minute = heapq.heappop(schedule_heap)
+        heapq.heappush(schedule_heap, (deadline + SECONDS_PER_WEEK, week_minute))
+        late = now - deadline
+        if last_fired.get(week_minute) == deadline:
+            continue  # already ran, e.g. the clock was set back over it
+        duration = window_length(week_minute)
+        if late > CATCH_UP_SECONDS or late >= duration * 60:
+            log.warning(f"Missed window start at minute {week_minute} by {late} seconds, skipping")
+            continue
+        last_fired[week_minute] = deadline
+        zone = zone_on_at(week_minute)
+        # Trigger the zone to start for the rest of its window
+        metrics.schedule_drift_ms.add(int(late * 1000))
+        log.info(f"Starting zone {zone} for {duration} minutes, {late} seconds late")
+        queue_zone_run(zone, duration * 60 - late, PRIORITY_SCHEDULE, deadline + duration * 60)
+    if not schedule_heap:
+        return MAX_SCHEDULER_SLEEP
+    return min(schedule_heap[0][0] - now, MAX_SCHEDULER_SLEEP)
+
+# Function to return the seconds until the next window start, MAX_SCHEDULER_SLEEP if the schedule is empty
+def seconds_to_next_start():
+    if not schedule_heap:
+        return MAX_SCHEDULER_SLEEP
+    return schedule_heap[0][0] - board.clock.time()
@@ -0,0 +1,52 @@
+# Pump duty cycle: keeps the pump inside its thermal budget
+# The pump is modelled as a leaky bucket of heat. Running fills it at (1 - PUMP_DUTY) per second, resting drains it at
+# PUMP_DUTY per second, and it may never hold more than PUMP_HEAT_LIMIT. So a cold pump can run
+# PUMP_HEAT_LIMIT / (1 - PUMP_DUTY) seconds in one go, and over any long stretch it pumps at most PUMP_DUTY of the time.
+# The zone runner in controller.py waters in pulses that fit the budget and moves the selector while the pump cools.
+# Times passed in are millisecond ticks (see hal.py), so setting the clock doesn't upset the budget
+from hal import ticks_diff
+
+# Share of the time the pump may run in the long run (the note under the form's schedule assumes 50%), more than 0 and up to 1
+PUMP_DUTY = 0.5
+# Heat the pump can soak up, in seconds of running at full duty. 60 lets a cold pump run 2 minutes straight
+PUMP_HEAT_LIMIT = 60
+# Shortest pulse worth switching the pump on for. Once hot the pump rests until it can run this long
+MIN_PULSE_SECONDS = 20
+
+class PumpBudget:
+    def __init__(self, duty=PUMP_DUTY, limit=PUMP_HEAT_LIMIT):
+        self.duty = duty
+        self.limit = limit
+        self.heat = 0
+        self.updated = None  # ticks heat was worked out at
+        self.running = False
+
+    # Heat at ticks now
+    def level(self, now):
+        if self.updated is None:
+            return self.heat
+        elapsed = ticks_diff(now, self.updated) / 1000
+        if elapsed < 0:
+            elapsed = 1 << 20  # ticks wrapped after days of rest, the pump is cold
+        if self.running:
+            return self.heat + elapsed * (1 - self.duty)
+        return max(self.heat - elapsed * self.duty, 0)
+
+    # Tell the budget the pump was switched on or off
+    def switch(self, running, now):
+        self.heat = self.level(now)
+        self.updated = now
+        self.running = running
+
+    # Seconds the pump can run from now before it reaches the limit
+    def allowance(self, now):
+        if self.duty >= 1:
+            return 1 << 30
+        return max(self.limit - self.level(now), 0) / (1 - self.duty)
+
+    # Seconds the pump has to rest before it can run for pulse seconds
+    def rest_needed(self, now, pulse=MIN_PULSE_SECONDS):
+        if self.duty >= 1:
+            return 0
+        excess = self.level(now) + min(pulse, self.limit / (1 - self.duty)) * (1 - self.duty) - self.limit
+        return max(excess, 0) / self.duty
@@ -0,0 +1,163 @@
+# Hardware abstraction layer
+# The Pico code only talks to the pump, the zone selector servo, the clock, the access point and the CPU power through a board
+# (controller.board, see PicoBoard), so the same code runs on the Pico or against the host simulator in tools/simulator.py
+# The simulator board has the same methods, with a virtual clock and recorded outputs instead of pins
+import time
+try:
+    from time import ticks_ms, ticks_diff, sleep_ms
+except ImportError:
+    # CPython (host tools) has no ticks
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+    def sleep_ms(ms):
+        time.sleep(ms / 1000)
+
+# Selector servo pulse width for each zone, in nanoseconds. Zone 0 = all zones off
+ZONE_NS = [390000, 660000, 980000, 1350000, 1670000, 1990000, 2300000, 2600000]
+
+PUMP_PIN = 13
+SELECTOR_PIN = 0
+#SOLENOID_PIN = 18 #to be added later
+
+# The selector arm needs this long for a full sweep (zone 0 to zone 7), shorter moves take a share of it
+SELECTOR_FULL_SWEEP_SECONDS = 2.0
+# Extra time for the arm to settle once it gets there
+SELECTOR_SETTLE_SECONDS = 0.1
+
+# Function to work out how long the selector arm takes to move between two zones
+# from_zone None means the position is unknown (just powered up), so allow a full sweep
+def selector_travel_time(from_zone, to_zone):
+    if from_zone is None:
+        return SELECTOR_FULL_SWEEP_SECONDS + SELECTOR_SETTLE_SECONDS
+    if from_zone == to_zone:
+        return 0
+    distance = abs(ZONE_NS[to_zone] - ZONE_NS[from_zone])
+    return SELECTOR_FULL_SWEEP_SECONDS * distance / (ZONE_NS[-1] - ZONE_NS[0]) + SELECTOR_SETTLE_SECONDS
+
+# Function to work out how long the arm takes to get to to_zone when it is sent there left seconds before it
+# reaches from_zone (a move cut short). Never longer than a full sweep, which gets it anywhere from anywhere
+def selector_wait_time(from_zone, to_zone, left):
+    return min(max(left, 0) + selector_travel_time(from_zone, to_zone), selector_travel_time(None, to_zone))
+
+class PicoPump:
+    # The pump, PWM on pin 13 (full duty = on). The PWM channel stays open for as long as the board lives
+    def __init__(self, pin=PUMP_PIN):
+        from machine import Pin, PWM
+        self.pwm = PWM(Pin(pin), freq=50, duty_u16=0)
+        self.duty = 0
+
+    def on(self):
+        self.duty = 65535
+        self.pwm.duty_u16(self.duty)
+
+    def off(self):
+        self.duty = 0
+        self.pwm.duty_u16(self.duty)
+
+    # Set the PWM up again after the CPU clock changed (the PWM runs off the CPU clock)
+    def retune(self):
+        self.pwm.freq(50)
+        self.pwm.duty_u16(self.duty)
+
+    def release(self):
+        self.pwm.deinit()  # release pins
+
+class PicoSelector:
+    # The zone selector servo, PWM on pin 0. Stays open and remembers where the arm is
+    def __init__(self, pin=SELECTOR_PIN):
+        from machine import Pin, PWM
+        self.duty_ns = 380000
+        self.pwm = PWM(Pin(pin), freq=50, duty_ns=self.duty_ns)
+        self.position = None  # zone the arm is at or on its way to, None until the first move
+        self.arrives = 0  # ticks the arm gets there
+
+    # Send the arm to a zone. Returns how many seconds to wait for it to get there, the rest of a move it
+    # hadn't finished included
+    def move_to(self, zone):
+        now = ticks_ms()
+        travel = selector_wait_time(self.position, zone, ticks_diff(self.arrives, now) / 1000)
+        self.duty_ns = ZONE_NS[zone]
+        self.pwm.duty_ns(self.duty_ns)
+        self.position = zone
+        self.arrives = now + int(travel * 1000)
+        return travel
+
+    # Set the PWM up again after the CPU clock changed, so the arm holds its place
+    def retune(self):
+        self.pwm.freq(50)
+        self.pwm.duty_ns(self.duty_ns)
+
+    def release(self):
+        self.pwm.deinit()  # release pins
+
+class PicoClock:
+    # Wall clock time from the RTC, and millisecond ticks for measuring how long things take
+    # (ticks wrap around, so compare them with ticks_diff). Sleeping is left to asyncio, except on core 1
+    def time(self):
+        return time.time()
+
+    def ticks_ms(self):
+        return ticks_ms()
+
+    def sleep_ms(self, ms):
+        sleep_ms(ms)
+
+    def localtime(self, t=None):
+        return time.localtime() if t is None else time.localtime(t)
+
+    # Set the time of day. The date is fixed because the UI only sets hours and minutes
+    # Example: Set time to March 18, 2025, Tuesday, at the provided hour and minute
+    def set_time(self, hours, minutes):
+        import machine
+        machine.RTC().datetime((2025, 3, 18, 2, hours, minutes, 0, 0))  # Set year, month, day, weekday, hours, minutes, seconds, subseconds
+
+class PicoAccessPoint:
+    # The Wi-Fi access point phones connect to
+    def __init__(self):
+        import network
+        self.wlan = network.WLAN(network.AP_IF)
+
+    def start(self, ssid, password):
+        self.wlan.active(True)
+        self.wlan.config(essid=ssid, password=password)
+
+    def active(self):
+        return self.wlan.active()
+
+    def ifconfig(self):
+        return self.wlan.ifconfig()
+
+# CPU clock for low-power idle (MicroPython's lowest clock USB still works at)
+LOW_CLOCK_HZ = 48_000_000
+
+class PicoPower:
+    # CPU clock and light sleep, for low-power idle (see power.py)
+    # The PWM outputs are clocked from the CPU clock, so changing it would change the servo pulses and the pump's
+    # PWM: pwm_devices are set up again after every change
+    def __init__(self, pwm_devices=()):
+        import machine
+        self.machine = machine
+        self.full_clock = machine.freq()
+        self.pwm_devices = pwm_devices
+
+    def set_low_clock(self, low):
+        self.machine.freq(LOW_CLOCK_HZ if low else self.full_clock)
+        for device in self.pwm_devices:
+            device.retune()
+
+    # Stop the Pico for up to ms. The timer wakes it, and on the Pico W so does the Wi-Fi chip
+    def lightsleep(self, ms):
+        self.machine.lightsleep(ms)
+
+class PicoBoard:
+    # Everything the Pico code drives on the real hardware
+    def __init__(self):
+        self.pump = PicoPump()
+        self.selector = PicoSelector()
+        self.clock = PicoClock()
+        self.ap = PicoAccessPoint()
+        self.power = PicoPower((self.pump, self.selector))
@@ -0,0 +1,26 @@
+# Log levels for the serial console
+# Every print over USB serial costs time in the loop, so messages have a level and only the ones at or above
+# log.level are printed. Set log.level = log.WARNING (or higher) in production, log.DEBUG to see every request and pulse
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+
+level = INFO
+
+def debug(*args):
+    if level <= DEBUG:
+        print(*args)
+
+def info(*args):
+    if level <= INFO:
+        print(*args)
+
+def warning(*args):
+    if level <= WARNING:
+        print(*args)
+
+def error(*args):
+    if level <= ERROR:
+        print(*args)
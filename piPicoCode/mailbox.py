@@ -0,0 +1,124 @@
+# Mailbox between the two cores in dual-core mode (see controller.core1_worker)
+# Core 0 posts commands into a fixed ring of slots and core 1 takes them, core 1 publishes a block of status rows
+# that core 0 reads. Everything lives in preallocated arrays guarded by one _thread lock, so passing a message
+# never allocates and neither core ever sees half a command or half a status update
+import _thread
+import asyncio
+from array import array
+from hal import sleep_ms, ticks_diff, ticks_ms
+try:
+    from asyncio import sleep_ms as async_sleep_ms
+except ImportError:
+    # CPython (host tools) has no asyncio.sleep_ms
+    async def async_sleep_ms(ms):
+        await asyncio.sleep(ms / 1000)
+
+# Commands, with the fields they carry
+CMD_RUN = 1       # zone, seconds, priority, seconds until the deadline (-1 for none)
+CMD_CANCEL = 2    # stop the running zone and empty the queue
+CMD_SCHEDULE = 3  # the schedule was saved, rebuild the calendar from schedule_store.saved_windows
+CMD_CLOCK = 4     # the clock was set, plan the schedule again
+CMD_STOP = 5      # stop core 1 (used by tools/stress_dual_core.py)
+
+COMMAND_FIELDS = 5
+MAILBOX_SLOTS = 16
+# How long post(wait=True) and post_async wait for a free slot before giving up, core 1 takes commands every CORE1_POLL_MS
+POST_TIMEOUT_MS = 2000
+
+# Status rows, one per run: state, zone, seconds left, priority, runs merged, and how many seconds ago the run was
+# queued, started and finished (-1 for not yet). Ages rather than clock times, so they stay small ints.
+# Published with two more numbers: a count that goes up whenever a run is queued, started or stopped, and the clock
+# time (whole seconds) that last happened at. They are the ETag and Last-Modified of /api/status
+STATUS_FIELDS = 8
+STATUS_RUNNING = 1
+STATUS_QUEUED = 2
+STATUS_DONE = 3
+
+class Mailbox:
+    def __init__(self, status_rows, slots=MAILBOX_SLOTS):
+        self.lock = _thread.allocate_lock()
+        self.commands = array("l", [0] * (slots * COMMAND_FIELDS))
+        self.slots = slots
+        self.head = 0  # slot of the oldest command
+        self.count = 0  # commands waiting
+        self.posted = 0
+        self.taken = 0
+        self.status = array("l", [0] * (status_rows * STATUS_FIELDS))
+        self.status_rows = 0
+        self.status_version = 0
+        self.status_modified = 0
+
+    # Post a command for core 1. Returns False if the mailbox is full, or with wait=True waits up to
+    # POST_TIMEOUT_MS for a free slot first (so a stuck core 1 can't hang the web server too)
+    def post(self, op, a=0, b=0, c=0, d=0, wait=False):
+        began = ticks_ms()
+        while True:
+            self.lock.acquire()
+            try:
+                if self.count < self.slots:
+                    i = (self.head + self.count) % self.slots * COMMAND_FIELDS
+                    commands = self.commands
+                    commands[i] = op
+                    commands[i + 1] = a
+                    commands[i + 2] = b
+                    commands[i + 3] = c
+                    commands[i + 4] = d
+                    self.count += 1
+                    self.posted += 1
+                    return True
+            finally:
+                self.lock.release()
+            if not wait or ticks_diff(ticks_ms(), began) > POST_TIMEOUT_MS:
+                return False
+            sleep_ms(5)
+
+    # Post a command for core 1 from a task on core 0, waiting up to POST_TIMEOUT_MS for a free slot like
+    # post(wait=True), but letting the other tasks run meanwhile. Returns False if no slot came free
+    async def post_async(self, op, a=0, b=0, c=0, d=0):
+        began = ticks_ms()
+        while not self.post(op, a, b, c, d):
+            if ticks_diff(ticks_ms(), began) > POST_TIMEOUT_MS:
+                return False
+            await async_sleep_ms(5)
+        return True
+
+    # Copy the oldest command into out (an array of COMMAND_FIELDS). Returns False if there is none
+    def take(self, out):
+        self.lock.acquire()
+        try:
+            if not self.count:
+                return False
+            i = self.head * COMMAND_FIELDS
+            for field in range(COMMAND_FIELDS):
+                out[field] = self.commands[i + field]
+            self.head = (self.head + 1) % self.slots
+            self.count -= 1
+            self.taken += 1
+            return True
+        finally:
+            self.lock.release()
+
+    # Replace the status block with the first rows rows of status (core 1)
+    def publish(self, status, rows, version, modified):
+        self.lock.acquire()
+        try:
+            for i in range(rows * STATUS_FIELDS):
+                self.status[i] = status[i]
+            self.status_rows = rows
+            self.status_version = version
+            self.status_modified = modified
+        finally:
+            self.lock.release()
+
+    # Copy the status block into out and its version and modified time into info[0] and info[1] (core 0).
+    # Returns how many rows it holds
+    def read_status(self, out, info):
+        self.lock.acquire()
+        try:
+            for i in range(self.status_rows * STATUS_FIELDS):
+                out[i] = self.status[i]
+            info[0] = self.status_version
+            info[1] = self.status_modified
+            return self.status_rows
+        finally:
+            self.lock.release()
@@ -0,0 +1,75 @@
+# Metrics kept in preallocated ring buffers, so recording a sample never allocates
+# Request latency, event loop lag, schedule start drift, free heap, pump seconds per zone and how long the boot
+# took are recorded here and served at /metrics (see render_metrics)
+from array import array
+from hal import ZONE_NS, ticks_ms, ticks_diff
+
+# Samples each ring buffer keeps
+RING_SIZE = 64
+
+class Ring:
+    # The last RING_SIZE samples of one measurement, as whole numbers (ms, bytes)
+    def __init__(self, size=RING_SIZE):
+        self.values = array("l", [0] * size)
+        self.next = 0
+        self.count = 0  # samples recorded ever, the buffer holds the last len(values) of them
+
+    def add(self, value):
+        self.values[self.next] = value
+        self.next = (self.next + 1) % len(self.values)
+        self.count += 1
+
+    # Function to summarise the samples in the buffer as "n=.. min=.. mean=.. p95=.. max=.. last=.."
+    def summary(self):
+        held = min(self.count, len(self.values))
+        if not held:
+            return f"n={self.count}"
+        samples = sorted(self.values[:held])
+        last = self.values[(self.next - 1) % len(self.values)]
+        return (f"n={self.count} min={samples[0]} mean={sum(samples) // held} "
+                f"p95={samples[held * 95 // 100]} max={samples[-1]} last={last}")
+
+# Time from accepting a request to the end of the response, ms
+request_ms = Ring()
+# How late the loop monitor wakes up, i.e. the longest any task held the event loop, ms
+loop_lag_ms = Ring()
+# How late a schedule window started compared to its minute, ms
+schedule_drift_ms = Ring()
+# Free heap, bytes
+mem_free = Ring()
+# Seconds the pump ran on each zone since boot (index = zone)
+pump_seconds = array("l", [0] * len(ZONE_NS))
+# Ticks when main.py started. On the Pico ticks start at 0 at reset, so this is also how long the firmware took
+boot_ms = ticks_ms()
+
+# Boot steps, each recorded once as ms after boot_ms (-1 until it happens), see main.serve_page
+BOOT_CONTROLLER = 0  # schedule loaded and the controller started
+BOOT_SCHEDULER = 1   # first schedule check done, windows due now have been queued
+BOOT_WEB = 2         # web.py imported
+BOOT_AP = 3          # access point up
+BOOT_LISTENING = 4   # web server listening
+BOOT_FIRST_REQUEST = 5  # first request answered
+BOOT_STEPS = ("controller", "scheduler_ready", "web", "ap_active", "listening", "first_request")
+boot_steps = array("l", [-1] * len(BOOT_STEPS))
+
+# Function to record that a boot step was reached. Returns True the first time, False if it was already recorded
+def boot_mark(step):
+    if boot_steps[step] >= 0:
+        return False
+    boot_steps[step] = ticks_diff(ticks_ms(), boot_ms)
+    return True
+
+# Function to render the boot steps as "reset=.. controller=.. scheduler_ready=.. ..." (ms, -1 for not yet)
+def render_boot():
+    return f"reset={boot_ms} " + " ".join(f"{name}={boot_steps[step]}" for step, name in enumerate(BOOT_STEPS))
+
+# Function to render the metrics as compact text, one line per measurement
+def render_metrics():
+    pumped = " ".join(f"zone{zone}={pump_seconds[zone]}" for zone in range(1, len(pump_seconds)))
+    return (f"uptime_s {ticks_diff(ticks_ms(), boot_ms) // 1000}\n"
+            f"request_ms {request_ms.summary()}\n"
+            f"loop_lag_ms {loop_lag_ms.summary()}\n"
+            f"schedule_drift_ms {schedule_drift_ms.summary()}\n"
+            f"mem_free {mem_free.summary()}\n"
+            f"pump_s {pumped}\n"
+            f"boot_ms {render_boot()}\n")
@@ -0,0 +1,129 @@
+# Low-power idle: light sleep, or a slower CPU clock, between scheduled events while nothing else is going on
+# For solar or battery installs, switched on with LOW_POWER in main.py. Only works with everything on core 0.
+# The board idles when no run is watering or queued, the selector arm is parked, no client was served in the last
+# CLIENT_AWAKE_MS and the next window start is further off than WAKE_EARLY_S. Light sleep stops the whole Pico,
+# the event loop included, for at most SLEEP_SLICE_MS at a time and ends WAKE_EARLY_S before the next window start.
+# The Wi-Fi chip keeps the access point up meanwhile, and a light sleep that ends early (the Wi-Fi chip woke it)
+# keeps the board awake for CLIENT_AWAKE_MS to serve whoever connected.
+# Time spent in each state is counted, and served at /metrics with an estimate of the energy used per day
+import asyncio
+import controller
+import log
+from hal import ticks_diff
+
+MODE_LIGHTSLEEP = "lightsleep"  # machine.lightsleep between events, saves the most
+MODE_CLOCK = "clock"            # only lower the CPU clock, the loop keeps running and answers clients at once
+
+# Longest single light sleep
+SLEEP_SLICE_MS = 5000
+# Shortest light sleep worth going into
+MIN_SLEEP_MS = 50
+# Awake this long before a window start, so the scheduler fires it on time
+WAKE_EARLY_S = 2
+# Awake this long after a client, a phone loading the form sends a few requests in a row
+CLIENT_AWAKE_MS = 10000
+# How often to look again while the board has to stay awake
+CHECK_MS = 500
+
+# Power states
+AWAKE = 0
+LOW_CLOCK = 1
+ASLEEP = 2
+STATES = ("awake", "low_clock", "asleep")
+# Rough supply current of the Pico W in each state with the access point up, mA on VSYS, not counting the pump.
+# Measure your own board and put the numbers here for a better energy estimate
+CURRENT_MA = (45, 32, 18)
+
+mode = None  # None until power_saver runs
+state = AWAKE
+state_since = 0
+state_ms = [0, 0, 0]  # ms spent in each state so far, the current one not included
+sleeps = 0
+woken_early = 0
+# Clients being served now, and ticks when the last one finished (None for no client yet)
+clients_open = 0
+last_client_ms = None
+
+# Functions for web.py to report clients, so the board stays awake while it serves them
+def client_started():
+    global clients_open
+    clients_open += 1
+    if state == LOW_CLOCK:
+        set_state(AWAKE, controller.board.clock.ticks_ms())  # full speed for the answer
+
+def client_done():
+    global clients_open, last_client_ms
+    clients_open -= 1
+    last_client_ms = controller.board.clock.ticks_ms()
+
+# Function to work out how long the board may idle from ticks now. Returns ms, 0 if it has to stay awake
+def idle_ms(now):
+    if clients_open or (last_client_ms is not None and ticks_diff(now, last_client_ms) < CLIENT_AWAKE_MS):
+        return 0
+    if not controller.runner_idle() or controller.schedule_changed.is_set():
+        return 0
+    until_start = int((controller.seconds_to_next_start() - WAKE_EARLY_S) * 1000)
+    if until_start < MIN_SLEEP_MS:
+        return 0
+    return min(until_start, SLEEP_SLICE_MS)
+
+# Function to switch to a new power state at ticks now, adding up the time spent in the old one
+def set_state(new_state, now):
+    global state, state_since
+    if new_state == state:
+        return
+    state_ms[state] += ticks_diff(now, state_since)
+    if new_state == LOW_CLOCK or state == LOW_CLOCK:
+        controller.board.power.set_low_clock(new_state == LOW_CLOCK)
+    state = new_state
+    state_since = now
+
+# Power saver task, runs next to the controller and the web server
+async def power_saver(power_mode=MODE_LIGHTSLEEP):
+    global mode, state_since, sleeps, woken_early, last_client_ms
+    mode = power_mode
+    clock = controller.board.clock
+    state_since = clock.ticks_ms()
+    log.info(f"Low-power idle on ({mode})")
+    while True:
+        now = clock.ticks_ms()
+        sleep = idle_ms(now)
+        if not sleep:
+            set_state(AWAKE, now)
+            await asyncio.sleep(CHECK_MS / 1000)
+        elif mode == MODE_CLOCK:
+            set_state(LOW_CLOCK, now)
+            await asyncio.sleep(min(sleep, CHECK_MS) / 1000)
+        else:
+            set_state(ASLEEP, now)
+            controller.board.power.lightsleep(sleep)
+            woke = clock.ticks_ms()
+            set_state(AWAKE, woke)
+            sleeps += 1
+            if ticks_diff(woke, now) < sleep - MIN_SLEEP_MS:
+                woken_early += 1
+                last_client_ms = woke  # most likely Wi-Fi traffic, stay awake for the client
+            await asyncio.sleep(0)  # let the loop catch up on whatever woke the board
+
+# Function to return ms spent in each state so far, the current one included
+def totals():
+    spent = list(state_ms)
+    spent[state] += ticks_diff(controller.board.clock.ticks_ms(), state_since)
+    return spent
+
+# Function to estimate the Pico's energy per day from the time spent in each state, mAh on VSYS
+def estimate_mah_per_day(spent):
+    total = sum(spent)
+    if not total:
+        return 0
+    return sum(ms * ma for ms, ma in zip(spent, CURRENT_MA)) / total * 24
+
+# Function to render the power line for /metrics ("" while low-power idle is off)
+def render_power():
+    if mode is None:
+        return ""
+    spent = totals()
+    total = max(sum(spent), 1)
+    times = " ".join(f"{name}_ms={ms}" for name, ms in zip(STATES, spent))
+    return (f"power mode={mode} {times} idle_duty={(total - spent[AWAKE]) * 100 / total:.1f}% sleeps={sleeps} "
+            f"woken_early={woken_early} est_mAh_day={estimate_mah_per_day(spent):.0f}\n")
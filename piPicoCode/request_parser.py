@@ -0,0 +1,174 @@
+# Single pass HTTP request parser for the web server in web.py
+# Requests are read straight into a preallocated bytearray (readinto + memoryview, no per-read bytes objects),
+# the head is walked once to find the method, path, Content-Length and the conditional GET headers,
+# and the form body is decoded in one pass
+
+REQUEST_BUFFER_SIZE = 2048
+
+# Scratch space the form decoder writes decoded bytes into. Parsing never awaits, so one buffer is enough
+form_scratch = bytearray(REQUEST_BUFFER_SIZE)
+
+CONTENT_LENGTH = b"content-length:"
+IF_NONE_MATCH = b"if-none-match:"
+IF_MODIFIED_SINCE = b"if-modified-since:"
+
+class RequestError(Exception):
+    # Raised for requests that can't be handled, carries the HTTP status to answer with
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# Function to read from a stream into a memoryview. MicroPython streams read straight into it,
+# CPython streams (host simulator) don't have readinto so the bytes are copied in
+async def read_into(reader, view):
+    if hasattr(reader, "readinto"):
+        return await reader.readinto(view)
+    data = await reader.read(len(view))
+    view[:len(data)] = data
+    return len(data)
+
+# Function to find the end of the request head (the byte after "\r\n\r\n") in buf[start:end], or -1
+def find_head_end(buf, start, end):
+    i = start
+    while i < end - 3:
+        if buf[i + 3] != 10:  # skip ahead unless this could be the last byte of "\r\n\r\n"
+            i += 1
+        elif buf[i] == 13 and buf[i + 1] == 10 and buf[i + 2] == 13:
+            return i + 4
+        else:
+            i += 1
+    return -1
+
+# Function to check (case-insensitively) if the header line at buf[start:end] is the header name (lowercase, with ":")
+def is_header(buf, start, end, name):
+    if end - start < len(name):
+        return False
+    for i in range(len(name)):
+        if buf[start + i] | 0x20 != name[i]:  # | 0x20 lowercases letters and leaves "-" and ":" alone
+            return False
+    return True
+
+# Function to return the value of the header line at buf[start:end] as bytes, without the name and spaces around it
+def header_value(buf, start, end, name):
+    start += len(name)
+    while start < end and buf[start] == 32:
+        start += 1
+    while end > start and buf[end - 1] == 32:
+        end -= 1
+    return bytes(memoryview(buf)[start:end])
+
+# Function to parse the request line and headers in buf[:head_end]
+# Returns (method, path, content_length, if_none_match, if_modified_since), method and path as bytes with any
+# query string dropped, and the two conditional headers as bytes (None if the request doesn't have them)
+def parse_head(buf, head_end):
+    mv = memoryview(buf)
+    # Request line: METHOD SP PATH SP VERSION
+    i = 0
+    while i < head_end and buf[i] != 32:
+        i += 1
+    method = bytes(mv[:i])
+    path_start = i + 1
+    i = path_start
+    while i < head_end and buf[i] != 32 and buf[i] != 63:  # space or "?"
+        i += 1
+    path = bytes(mv[path_start:i])
+    if not method or not path:
+        raise RequestError(400, "Bad request line")
+
+    # Headers, one per line. Only Content-Length and the conditional GET ones are kept
+    content_length = 0
+    if_none_match = if_modified_since = None
+    while i < head_end and buf[i] != 10:
+        i += 1
+    line_start = i + 1
+    while line_start < head_end - 2:
+        line_end = line_start
+        while line_end < head_end and buf[line_end] != 13:
+            line_end += 1
+        if is_header(buf, line_start, line_end, CONTENT_LENGTH):
+            j = line_start + len(CONTENT_LENGTH)
+            while j < line_end:
+                c = buf[j]
+                if 48 <= c <= 57:
+                    content_length = content_length * 10 + c - 48
+                elif c != 32:
+                    raise RequestError(400, "Bad Content-Length")
+                j += 1
+        elif is_header(buf, line_start, line_end, IF_NONE_MATCH):
+            if_none_match = header_value(buf, line_start, line_end, IF_NONE_MATCH)
+        elif is_header(buf, line_start, line_end, IF_MODIFIED_SINCE):
+            if_modified_since = header_value(buf, line_start, line_end, IF_MODIFIED_SINCE)
+        line_start = line_end + 2
+    return method, path, content_length, if_none_match, if_modified_since
+
+# Function to read a whole request into buf. Keeps reading until the head and Content-Length bytes of body arrived
+# Returns (method, path, body, if_none_match, if_modified_since) with body a memoryview into buf,
+# or None if the client closed before sending anything
+async def read_request(reader, buf):
+    mv = memoryview(buf)
+    n = 0
+    head_end = -1
+    while head_end < 0:
+        if n == len(buf):
+            raise RequestError(413, "Request head too large")
+        got = await read_into(reader, mv[n:])
+        if not got:
+            if n == 0:
+                return None
+            raise RequestError(400, "Incomplete request")
+        # "\r\n\r\n" may straddle the previous read, so look back 3 bytes
+        head_end = find_head_end(buf, max(n - 3, 0), n + got)
+        n += got
+
+    method, path, content_length, if_none_match, if_modified_since = parse_head(buf, head_end)
+    body_end = head_end + content_length
+    if body_end > len(buf):
+        raise RequestError(413, "Request body too large")
+    while n < body_end:
+        got = await read_into(reader, mv[n:body_end])
+        if not got:
+            raise RequestError(400, "Incomplete request body")
+        n += got
+    return method, path, mv[head_end:body_end], if_none_match, if_modified_since
+
+# Function to turn one hex digit (as a byte value) into its value, -1 if it isn't one
+def hex_value(c):
+    if 48 <= c <= 57:
+        return c - 48
+    c |= 0x20
+    if 97 <= c <= 102:
+        return c - 87
+    return -1
+
+# Function to decode an application/x-www-form-urlencoded body in one pass
+# Handles every %XX escape and "+" for space. Returns {name: value} with both as str
+def parse_form(body):
+    fields = {}
+    n = len(body)
+    k = 0  # bytes written to form_scratch for the current name or value
+    name = None
+    i = 0
+    while i <= n:
+        c = body[i] if i < n else 38  # pretend the body ends with "&"
+        if c == 38:  # "&" ends a field
+            if name is not None:
+                fields[name] = str(memoryview(form_scratch)[:k], "utf-8")
+            elif k:
+                fields[str(memoryview(form_scratch)[:k], "utf-8")] = ""
+            name = None
+            k = 0
+        elif c == 61 and name is None:  # "=" between name and value
+            name = str(memoryview(form_scratch)[:k], "utf-8")
+            k = 0
+        elif c == 43:  # "+"
+            form_scratch[k] = 32
+            k += 1
+        elif c == 37 and i + 2 < n and hex_value(body[i + 1]) >= 0 and hex_value(body[i + 2]) >= 0:  # "%XX"
+            form_scratch[k] = hex_value(body[i + 1]) * 16 + hex_value(body[i + 2])
+            k += 1
+            i += 2
+        else:
+            form_scratch[k] = c
+            k += 1
+        i += 1
+    return fields
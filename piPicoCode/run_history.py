@@ -0,0 +1,181 @@
+# Watering history: what actually ran, in a fixed ring in RAM, appended to flash in batches
+# Every finished run is one 8 byte "<IHBB" record: start (clock seconds), seconds the pump ran, zone and what
+# started it (a run_queue priority). The ring holds the last HISTORY_SIZE runs. Records go to history.bin
+# FLUSH_BATCH at a time, or once the oldest has waited FLUSH_AFTER_S, so flash is written seldom. When history.bin
+# holds FILE_RECORDS it becomes history.old and a new one is started, so the history never takes more than two
+# files on flash. Pump seconds per zone are also added up per day for the last DAYS days in a fixed table, for
+# the day's and the week's totals.
+# The zone runner adds records (on core 1 in dual-core mode) and the web server reads them, under one lock
+try:
+    import ustruct as struct
+except ImportError:
+    import struct  # CPython, for the host tools
+import _thread
+import log
+import os
+from array import array
+from hal import ZONE_NS
+
+HISTORY_FILE = "history.bin"
+OLD_FILE = "history.old"
+
+RECORD = "<IHBB"
+RECORD_SIZE = struct.calcsize(RECORD)
+MAX_SECONDS = 65535  # longest run a record holds
+
+# Runs the ring in RAM holds
+HISTORY_SIZE = 64
+# Records written to flash at once, and the longest a record waits to be written
+FLUSH_BATCH = 8
+FLUSH_AFTER_S = 600
+# Records per file, 4 KB
+FILE_RECORDS = 512
+# Days the per-zone totals go back
+DAYS = 7
+SECONDS_PER_DAY = 86400
+ZONES = len(ZONE_NS)  # index = zone, 0 unused
+
+ring = bytearray(HISTORY_SIZE * RECORD_SIZE)
+next_slot = 0
+held = 0  # records in the ring
+count = 0  # records added since boot, those loaded from flash included
+pending = 0  # newest records in the ring that aren't on flash yet
+pending_since = 0  # clock time the oldest of them was added
+modified = 0  # clock time (whole seconds) the last record was added, the Last-Modified of /api/history
+# Pump seconds per zone for each of the last DAYS days: row day % DAYS, holding day number slot_day[row]
+day_seconds = array("l", [0] * (DAYS * ZONES))
+slot_day = array("l", [-1] * DAYS)
+newest_day = -1  # latest day number added to the table
+lock = _thread.allocate_lock()
+
+# Function to add pump seconds to the totals of the day start falls on
+# A day before the newest one in the table means the clock was set back (setting the time always sets the date
+# to 2025-03-18), and the days in the table no longer line up with the clock, so the totals start over
+def add_to_totals(zone, start, seconds):
+    global newest_day
+    day = start // SECONDS_PER_DAY
+    if day < newest_day:
+        clear_totals()
+    newest_day = day
+    row = day % DAYS
+    if slot_day[row] != day:
+        slot_day[row] = day
+        for i in range(row * ZONES, (row + 1) * ZONES):
+            day_seconds[i] = 0
+    day_seconds[row * ZONES + zone] += seconds
+
+# Function to empty the per-day totals
+def clear_totals():
+    for i in range(DAYS * ZONES):
+        day_seconds[i] = 0
+    for row in range(DAYS):
+        slot_day[row] = -1
+
+# Function to put a record in the ring and the totals (lock held)
+def put(zone, start, seconds, trigger):
+    global next_slot, held, count
+    struct.pack_into(RECORD, ring, next_slot * RECORD_SIZE, start, seconds, zone, trigger)
+    next_slot = (next_slot + 1) % HISTORY_SIZE
+    held = min(held + 1, HISTORY_SIZE)
+    count += 1
+    add_to_totals(zone, start, seconds)
+
+# Function to record a finished run: zone, start (clock seconds), seconds the pump ran and the run's priority.
+# now is the clock time
+def add(zone, start, seconds, trigger, now):
+    global pending, pending_since, modified
+    lock.acquire()
+    try:
+        put(zone, int(start), min(int(seconds), MAX_SECONDS), trigger)
+        if not pending:
+            pending_since = now
+        if pending == HISTORY_SIZE:
+            log.warning("Run history not written to flash in time, oldest run lost")
+        pending = min(pending + 1, HISTORY_SIZE)
+        modified = int(now)
+    finally:
+        lock.release()
+
+# Function to tell if the records waiting should be written to flash now
+def flush_due(now):
+    return pending >= FLUSH_BATCH or (pending > 0 and now - pending_since >= FLUSH_AFTER_S)
+
+# Function to append the records waiting to history.bin, starting a new file when it is full
+# Only ever called on core 0, so core 1 never writes to flash
+def flush():
+    global pending
+    lock.acquire()
+    try:
+        records = pending
+        data = bytearray(records * RECORD_SIZE)
+        for i in range(records):
+            slot = (next_slot - records + i) % HISTORY_SIZE
+            data[i * RECORD_SIZE:(i + 1) * RECORD_SIZE] = ring[slot * RECORD_SIZE:(slot + 1) * RECORD_SIZE]
+    finally:
+        lock.release()
+    try:
+        try:
+            size = os.stat(HISTORY_FILE)[6]
+        except OSError:
+            size = 0
+        if size + len(data) > FILE_RECORDS * RECORD_SIZE:
+            os.rename(HISTORY_FILE, OLD_FILE)  # replaces the old one
+        with open(HISTORY_FILE, "ab") as f:
+            f.write(data)
+    except OSError as e:
+        log.error(f"Could not write run history: {e}")
+        return
+    lock.acquire()
+    try:
+        pending -= records  # runs added meanwhile wait for the next flush
+    finally:
+        lock.release()
+
+# Function to load the history from flash into the ring and the totals, at boot
+def load():
+    for name in (OLD_FILE, HISTORY_FILE):
+        try:
+            with open(name, "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+        whole = len(data) - len(data) % RECORD_SIZE
+        if whole != len(data):
+            # A power cut during an append left part of a record, drop it so the next appends line up
+            log.warning(f"{name} ends in part of a record, dropping it")
+            with open(name, "wb") as f:
+                f.write(data[:whole])
+        for i in range(0, whole, RECORD_SIZE):
+            start, seconds, zone, trigger = struct.unpack_from(RECORD, data, i)
+            if 0 < zone < ZONES:
+                put(zone, start, seconds, trigger)
+    if count:
+        log.info(f"Run history: {count} runs loaded")
+
+# Function to return the pump seconds of zone on the day of now and over the last DAYS days up to it
+def totals(zone, now):
+    today = int(now) // SECONDS_PER_DAY
+    day = week = 0
+    lock.acquire()
+    try:
+        for row in range(DAYS):
+            if today - DAYS < slot_day[row] <= today:
+                week += day_seconds[row * ZONES + zone]
+                if slot_day[row] == today:
+                    day = day_seconds[row * ZONES + zone]
+    finally:
+        lock.release()
+    return day, week
+
+# Function to return up to n of the newest records as (zone, start, seconds, trigger), newest first
+def recent(n=HISTORY_SIZE):
+    runs = []
+    lock.acquire()
+    try:
+        for i in range(min(n, held)):
+            slot = (next_slot - 1 - i) % HISTORY_SIZE
+            start, seconds, zone, trigger = struct.unpack_from(RECORD, ring, slot * RECORD_SIZE)
+            runs.append((zone, start, seconds, trigger))
+    finally:
+        lock.release()
+    return runs
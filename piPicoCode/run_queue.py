@@ -0,0 +1,95 @@
+# Queue of zone runs waiting for the zone runner in controller.py
+# Runs are queued with a priority, and a run for a zone that already has one queued is merged into it.
+# Runs are watered in pulses (see duty_cycle.py) and go back in the queue between pulses. The next pulse goes to
+# the zone nearest the selector arm, unless that would leave a scheduled run no room for a pulse before its
+# window ends, then the scheduled run whose window ends first goes next
+from hal import selector_travel_time
+
+# Lower numbers run first, and a run preempts a running one with a higher number (see controller.start_zone_run)
+PRIORITY_TEST = 0  # instant tests from the web page, someone is standing there waiting
+PRIORITY_SCHEDULE = 1
+PRIORITY_NAMES = {PRIORITY_TEST: "test", PRIORITY_SCHEDULE: "schedule"}
+
+# Runs the queue holds at most, further ones are refused
+MAX_QUEUED_RUNS = 16
+
+class RunJob:
+    # One zone run. seconds is the watering time still to do and deadline the clock time the run has to be
+    # finished by (the end of its schedule window, None for no limit). queued, started and finished are clock
+    # times, started stays None until the pump first comes on
+    def __init__(self, zone, seconds, priority, queued, deadline=None):
+        self.zone = zone
+        self.seconds = seconds
+        self.priority = priority
+        self.deadline = deadline
+        self.queued = queued
+        self.started = None
+        self.finished = None
+        self.last_pulse = None  # clock time the pump last stopped on this job
+        self.pumped = 0  # seconds the pump has run on this job so far
+        self.step_began = None  # ticks the pump started on the seconds being watered now, None when not pumping
+        self.merged = 1  # how many requested runs this job stands for
+
+# Function to merge a run into another one for the same zone, so the zone waters once for both
+def merge_runs(job, other):
+    job.seconds += other.seconds
+    if job.deadline is None or other.deadline is None:
+        job.deadline = None
+    else:
+        job.deadline = max(job.deadline, other.deadline)
+    job.queued = min(job.queued, other.queued)
+    job.merged += other.merged
+
+class RunQueue:
+    def __init__(self):
+        self.jobs = []
+
+    # Add a run. Returns the queued job (an existing one if the run was merged into it), or None if the queue is full
+    def add(self, job):
+        for queued in self.jobs:
+            if queued.zone == job.zone and queued.priority == job.priority:
+                merge_runs(queued, job)
+                return queued
+        if len(self.jobs) >= MAX_QUEUED_RUNS:
+            return None
+        self.jobs.append(job)
+        return job
+
+    def clear(self):
+        self.jobs.clear()
+
+    # Take the run to do next, or None if there is nothing to do
+    # position is the zone the selector arm is at (None if unknown) and now the clock time. free_travel is how long
+    # the pump has to rest anyway: moves that fit in it cost nothing, and the zone that pumped longest ago goes first.
+    # pulse is the longest the pump can run in one go
+    def next_job(self, position, now, free_travel=0, pulse=1 << 30):
+        # Scheduled runs only water until their window ends, drop the ones whose window is already over
+        for job in self.jobs:
+            if job.deadline is not None:
+                job.seconds = min(job.seconds, job.deadline - now)
+        self.jobs = [job for job in self.jobs if job.seconds > 0]
+        if not self.jobs:
+            return None
+
+        best = min(job.priority for job in self.jobs)
+        candidates = [job for job in self.jobs if job.priority == best]
+        candidates.sort(key=lambda job: (max(selector_travel_time(position, job.zone) - free_travel, 0),
+                                         job.queued if job.last_pulse is None else job.last_pulse))
+        for job in candidates:
+            if self.keeps_deadlines(job, candidates, position, now, pulse):
+                break
+        else:
+            # Every order squeezes out some scheduled run, so start the one whose window ends first
+            job = min(candidates, key=lambda job: (job.deadline is None, job.deadline or 0))
+        self.jobs.remove(job)
+        return job
+
+    # Function to check that a pulse of job first still leaves every other scheduled candidate time for a pulse
+    # Works in seconds from now rather than clock times, as the Pico's single precision floats can't hold a clock time exactly
+    def keeps_deadlines(self, job, candidates, position, now, pulse):
+        done = selector_travel_time(position, job.zone) + min(job.seconds, pulse)
+        for other in candidates:
+            if other is not job and other.deadline is not None:
+                if done + selector_travel_time(job.zone, other.zone) + min(other.seconds, pulse) > other.deadline - now:
+                    return False
+        return True
@@ -0,0 +1,134 @@
+# Binary schedule store
+# schedule.bin is a header "<4sBBI" (magic, format version, window count, CRC-32 of the records)
+# followed by one fixed 6 byte "<BHHB" record per window: zone, start minute, stop minute, days
+# Saves go to a temp file that is renamed over schedule.bin, so a power cut leaves the old or the new schedule, never half
+try:
+    import ustruct as struct
+except ImportError:
+    import struct  # CPython, for the host tools
+import log
+import os
+try:
+    from binascii import crc32
+except ImportError:
+    crc32 = None  # ports built without it use the slower crc32_fallback below
+from windows import ALL_DAYS
+
+SCHEDULE_FILE = "schedule.bin"
+TEMP_FILE = "schedule.tmp"
+TEXT_FILE = "schedule.txt"  # the old text format, migrated to schedule.bin on first boot
+
+MAGIC = b"WSCH"
+VERSION = 1
+HEADER = "<4sBBI"
+RECORD = "<BHHB"
+HEADER_SIZE = struct.calcsize(HEADER)
+RECORD_SIZE = struct.calcsize(RECORD)
+
+# Used when there is no schedule at all: one minute per zone from 7:01
+DEFAULT_WINDOWS = [(1, 421, 422, ALL_DAYS), (2, 423, 424, ALL_DAYS), (3, 425, 426, ALL_DAYS), (4, 427, 428, ALL_DAYS),
+                   (5, 429, 430, ALL_DAYS), (6, 431, 432, ALL_DAYS), (7, 433, 434, ALL_DAYS)]
+
+# Windows as they are on flash right now, so saving an unchanged schedule doesn't write anything
+saved_windows = None
+# CRC-32 of the saved records, and a count that goes up whenever saved_windows changes (the ETag of /api/schedule)
+saved_crc = 0
+version = 0
+
+# Function to compute the CRC-32 (the zlib one) of some bytes, for ports whose binascii has no crc32
+def crc32_fallback(data, crc=0):
+    crc ^= 0xFFFFFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ (0xEDB88320 & -(crc & 1))
+    return crc ^ 0xFFFFFFFF
+
+if crc32 is None:
+    crc32 = crc32_fallback
+
+# Function to pack windows into the schedule.bin layout
+def pack_schedule(windows):
+    data = bytearray(HEADER_SIZE + RECORD_SIZE * len(windows))
+    for i, window in enumerate(windows):
+        struct.pack_into(RECORD, data, HEADER_SIZE + i * RECORD_SIZE, *window)
+    struct.pack_into(HEADER, data, 0, MAGIC, VERSION, len(windows), crc32(memoryview(data)[HEADER_SIZE:]))
+    return data
+
+# Function to unpack schedule.bin contents into windows. Raises ValueError if they are damaged
+def unpack_schedule(data):
+    if len(data) < HEADER_SIZE:
+        raise ValueError("schedule file too short")
+    magic, version, count, crc = struct.unpack_from(HEADER, data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a schedule file, or an unknown version")
+    if len(data) != HEADER_SIZE + count * RECORD_SIZE or crc32(memoryview(data)[HEADER_SIZE:]) != crc:
+        raise ValueError("schedule file is damaged")
+    return [struct.unpack_from(RECORD, data, HEADER_SIZE + i * RECORD_SIZE) for i in range(count)]
+
+# Function to split a schedule.txt line into (row, start_hour, start_minute, end_hour, end_minute, duration, days)
+# The days field is a weekday bitmask (bit 0 = Monday) and is optional, old 6 field lines run every day
+def parse_schedule_line(line):
+    parts = line.strip().split(', ')
+    if len(parts) not in (6, 7) or "NULL" in parts:
+        return None
+    try:
+        row = int(parts[0][3:])  # Extract the number from row1 -> 1, row2 -> 2, etc.
+        values = [int(part) for part in parts[1:]]
+    except ValueError:
+        return None
+    if len(values) == 5:
+        values.append(ALL_DAYS)
+    return [row] + values
+
+# Function to read the windows from an old schedule.txt
+def read_text_schedule(filename=TEXT_FILE):
+    windows = []
+    with open(filename, 'r') as f:
+        for line in f:
+            parts = parse_schedule_line(line)
+            if parts:
+                row, start_hour, start_minute, end_hour, end_minute, duration, days = parts
+                windows.append((row, start_hour * 60 + start_minute, end_hour * 60 + end_minute, days))
+    return windows
+
+# Function to load the schedule windows from flash
+# Falls back to migrating schedule.txt, and then to the default schedule, if schedule.bin is missing or damaged
+def load_schedule():
+    try:
+        with open(SCHEDULE_FILE, 'rb') as f:
+            data = f.read()
+        remember_saved(unpack_schedule(data), data)
+        return list(saved_windows)
+    except OSError:
+        log.info(f"{SCHEDULE_FILE} not found")
+    except ValueError as e:
+        log.warning(f"{SCHEDULE_FILE} can't be used: {e}")
+
+    try:
+        windows = read_text_schedule()
+        log.info(f"Migrating {TEXT_FILE} to {SCHEDULE_FILE}")
+    except OSError:
+        windows = DEFAULT_WINDOWS
+        log.info("No schedule found, using the default schedule")
+    save_schedule(windows)
+    return list(windows)
+
+# Function to save the schedule windows to flash. Returns False if nothing changed, so nothing was written
+def save_schedule(windows):
+    windows = [tuple(window) for window in windows]
+    if windows == saved_windows:
+        return False
+    data = pack_schedule(windows)
+    with open(TEMP_FILE, 'wb') as f:
+        f.write(data)
+    os.rename(TEMP_FILE, SCHEDULE_FILE)  # littlefs renames atomically, replacing the old file
+    remember_saved(windows, data)
+    return True
+
+# Function to note the windows now on flash, with data their schedule.bin contents
+def remember_saved(windows, data):
+    global saved_windows, saved_crc, version
+    saved_windows = windows
+    saved_crc = struct.unpack_from(HEADER, data, 0)[3]
+    version += 1
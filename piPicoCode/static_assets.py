@@ -0,0 +1,6 @@
+# Generated by tools/build_assets.py from web/, don't edit. Rebuild after changing anything in web/
+# URL path: (gzipped file on flash, Content-Type, size in bytes, link to it with its version)
+ASSETS = {
+    b"/static/form.css": ("static/form.css.gz", "text/css", 120, "/static/form.css?v=e1140766"),
+    b"/static/form.js": ("static/form.js.gz", "text/javascript", 518, "/static/form.js?v=fb057ba8"),
+}
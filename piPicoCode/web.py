@@ -0,0 +1,697 @@
+# Web server: the schedule form, the status page, the JSON API and the static files
+# Imported by main.py once the controller is running, while the access point comes up, so its pages and the
+# json module don't hold up the first schedule check. Talks to the controller through controller.py
+import asyncio
+import controller
+import json
+import log
+import metrics
+import power
+import run_history
+import schedule_store
+from windows import ALL_DAYS, time_to_minutes, window_minutes, find_conflicts, describe_conflict
+from schedule_store import save_schedule
+from request_parser import REQUEST_BUFFER_SIZE, RequestError, read_request, read_into, find_head_end, parse_form
+from run_queue import PRIORITY_NAMES
+from mailbox import CMD_SCHEDULE, STATUS_FIELDS, STATUS_RUNNING, STATUS_QUEUED, STATUS_DONE
+from controller import (build_calendar, cancel_zone_run, read_status, set_system_time, start_zone_run,
+                        status_info, status_rows)
+from static_assets import ASSETS
+
+# Pages sent back after a schedule submission
+SCHEDULE_ERROR_PAGE = """HTTP/1.1 200 OK
+Content-Type: text/html; charset=utf-8
+Connection: close
+
+<!DOCTYPE html>
+<html>
+<head><title>Schedule Submission Error</title></head>
+<body>
+<h1>Schedule not accepted, two or more zones overlap. Only 1 zone may operate at a time.</h1>
+<ul>
+{conflicts}
+</ul>
+<a href="/">Go back to Schedule Form</a>
+</body>
+</html>
+"""
+
+SCHEDULE_OK_PAGE = """HTTP/1.1 200 OK
+Content-Type: text/html; charset=utf-8
+Connection: close
+
+<!DOCTYPE html>
+<html>
+<head><title>Schedule Submitted</title></head>
+<body>
+<h1>Schedule Submitted Successfully!</h1>
+<a href="/">Go back to Schedule Form</a>
+</body>
+</html>
+"""
+
+# Function to send a response, either a whole page or a generator of chunks (see generate_schedule_form)
+# Chunks are written and drained one at a time so the page is never held in RAM all at once
+async def send_response(writer, response):
+    if isinstance(response, str):
+        response = (response.encode(),)
+    try:
+        for chunk in response:
+            writer.write(chunk)
+            await writer.drain()
+    finally:
+        if hasattr(response, "close"):
+            response.close()  # a generator stopped halfway (the client went away) closes the file it streams now
+
+# Buffers requests are read into, so receiving a request doesn't allocate. One per client being handled at once
+request_buffers = [bytearray(REQUEST_BUFFER_SIZE), bytearray(REQUEST_BUFFER_SIZE)]
+buffer_freed = asyncio.Event()
+# A client that finds both buffers in use waits this long for one before it gets a 503
+BUFFER_WAIT_MS = 1000
+# Most of a request read and dropped before an error answer (see drain_request), and the longest wait for more of it
+DRAIN_BYTES = 8192
+DRAIN_WAIT_MS = 50
+
+# Function to take a request buffer, waiting up to BUFFER_WAIT_MS for one to be freed. Returns None if none was
+async def take_buffer():
+    began = metrics.ticks_ms()
+    while not request_buffers:
+        left = BUFFER_WAIT_MS - metrics.ticks_diff(metrics.ticks_ms(), began)
+        if left <= 0:
+            return None
+        buffer_freed.clear()
+        try:
+            await asyncio.wait_for(buffer_freed.wait(), left / 1000)
+        except asyncio.TimeoutError:
+            return None
+    return request_buffers.pop()
+
+# Function to give a request buffer back and wake the clients waiting for one
+def free_buffer(buf):
+    request_buffers.append(buf)
+    buffer_freed.set()
+
+# Function to read and drop what the client sent that wasn't read, before an error answer. Closing a connection
+# with unread data resets it, and the client sees the reset instead of the answer. Reads into buf, or allocates
+# small reads when there is no buffer (a 503 for want of one). Stops once the client sends nothing for DRAIN_WAIT_MS
+async def drain_request(reader, buf):
+    left = DRAIN_BYTES
+    while left > 0:
+        try:
+            if buf is None:
+                got = len(await asyncio.wait_for(reader.read(min(left, 512)), DRAIN_WAIT_MS / 1000))
+            else:
+                got = await asyncio.wait_for(read_into(reader, memoryview(buf)[:min(left, len(buf))]),
+                                             DRAIN_WAIT_MS / 1000)
+        except asyncio.TimeoutError:
+            return
+        if not got:
+            return
+        left -= got
+
+# Function to build a short plain text response, used for errors and /metrics
+def text_response(status, message):
+    return f"HTTP/1.1 {status}\r\nContent-Type: text/plain\r\nConnection: close\r\n\r\n{message}\n"
+
+# Function to handle one client connection. Runs as its own task so a zone run never blocks it
+async def handle_client(reader, writer):
+    accepted = metrics.ticks_ms()
+    buf = None
+    request = None
+    power.client_started()
+    try:
+        log.debug('Client connected from', writer.get_extra_info('peername'))
+        buf = await take_buffer()
+        if buf is None:
+            await drain_request(reader, None)
+            await send_response(writer, text_response("503 Service Unavailable", "Busy, try again"))
+            return
+
+        # Receive request, the whole body even when it arrives over several reads
+        request = await asyncio.wait_for(read_request(reader, buf), 5.0)
+        if request is None:
+            return
+        method, path, body, if_none_match, if_modified_since = request
+        log.debug('Request:', method, path)
+
+        # Check if it's a POST request for form submission
+        if method == b"POST" and path == b"/submit_schedule":
+            # Extract the form data from the request
+            data = schedule_form_data(parse_form(body))
+
+            # Check for overlap
+            conflicts = check_for_overlap(data)
+            if conflicts:
+                response = SCHEDULE_ERROR_PAGE.format(conflicts="\n".join(f"<li>{describe_conflict(c)}</li>" for c in conflicts))
+            else:
+                # Write the schedule data to a file
+                await write_schedule_to_file(data)
+                response = SCHEDULE_OK_PAGE
+
+        # Handle the change time request
+        elif method == b"POST" and path == b"/change_time":
+            data = schedule_form_data(parse_form(body))
+            new_time = data.get('new_time')
+            if new_time:
+                await set_system_time(new_time)  # Call function to set the time
+            response = generate_schedule_form() #send back to the start
+
+        # Handle the Instant Test
+        elif method == b"POST" and path == b"/instant_test":
+            data = schedule_form_data(parse_form(body))
+            # Access the zone and runtime from the 'instant_test' key in the data
+            if "instant_test" in data:
+                zone = data["instant_test"].get("zone")
+                runtime = data["instant_test"].get("runtime")
+                # Ensure that zone and runtime are not None or empty
+                if zone and runtime:
+                    log.info(f"Testing zone {zone} for {runtime} seconds")
+                    if start_zone_run(zone, runtime) is None: #runs in the background, ahead of scheduled runs
+                        raise RequestError(503, "Run queue full, try again later")
+                else:
+                    log.warning("Error: Invalid zone or runtime data")
+            else:
+                log.warning("Error: Instant test data not found")
+            response = generate_schedule_form() #send back to the start
+
+        # Stop whatever zone is running
+        elif method == b"POST" and path == b"/cancel_run":
+            await cancel_zone_run()
+            response = generate_schedule_form() #send back to the start
+
+        # Show the run queue
+        elif path == b"/status":
+            response = generate_status_page()
+
+        # Numbers for checking on the controller (see metrics.py)
+        elif path == b"/metrics":
+            response = text_response("200 OK", metrics.render_metrics() + power.render_power())
+
+        # The form's CSS and JavaScript, gzipped on flash (see tools/build_assets.py)
+        elif path in ASSETS:
+            response = static_response(ASSETS[path], buf)
+
+        # JSON API for scripts and phones, see the JSON API section below
+        elif path == b"/api/schedule":
+            if method == b"GET":
+                response = api_get_schedule(if_none_match, if_modified_since)
+            elif method == b"PUT":
+                response = await api_put_schedule(body)
+            else:
+                raise RequestError(405, "Use GET or PUT")
+        elif path == b"/api/status":
+            response = api_get_status(if_none_match, if_modified_since)
+        elif path == b"/api/history":
+            response = api_get_history(if_none_match, if_modified_since)
+        elif path == b"/api/run":
+            if method == b"POST":
+                response = api_start_run(body)
+            elif method == b"DELETE":
+                await cancel_zone_run()
+                response = json_response("200 OK", b'{"cancelled":true}')
+            else:
+                raise RequestError(405, "Use POST or DELETE")
+
+        else:
+            # Display the schedule form
+            response = generate_schedule_form()
+
+        await send_response(writer, response)
+        metrics.request_ms.add(metrics.ticks_diff(metrics.ticks_ms(), accepted))
+        if metrics.boot_mark(metrics.BOOT_FIRST_REQUEST):
+            log.info(f"Boot times (ms): {metrics.render_boot()}")
+
+    except RequestError as e:
+        log.warning(f"Bad request: {e}")
+        if request is None:
+            await drain_request(reader, buf)  # the request couldn't be read, the rest of it is still coming
+        await send_response(writer, text_response(f"{e.status} Error", e))
+    except ValueError as e:
+        log.warning(f"Bad request data: {e}")
+        await send_response(writer, text_response("400 Bad Request", e))
+    except asyncio.TimeoutError:
+        log.warning("Client timed out")
+    except OSError as e:
+        log.error(f"Unexpected error: {e}")
+    finally:
+        if buf is not None:
+            free_buffer(buf)
+        power.client_done()
+        writer.close()
+        await writer.wait_closed()
+
+# Function to parse a raw POST request and extract the schedule data
+def parse_request(request):
+    head_end = find_head_end(request, 0, len(request))
+    body = memoryview(request)[head_end:] if head_end >= 0 else memoryview(b"")
+    return schedule_form_data(parse_form(body))
+
+# Function to arrange decoded form fields into the schedule data used by the rest of the code
+def schedule_form_data(fields):
+    # Initialize a dictionary to store the parsed data
+    data = {}
+
+    # The system time (if any)
+    if "new_time" in fields:
+        data["new_time"] = fields["new_time"]
+
+    # The schedule data (start and stop times for each zone)
+    for i in range(1, 8):
+        data[f"row{i}"] = {"start": fields.get(f"start{i}", "NULL"), "stop": fields.get(f"stop{i}", "NULL")}
+
+    # The instant test zone and runtime (if any)
+    if "zone" in fields and "runtime" in fields:
+        data["instant_test"] = {"zone": fields["zone"], "runtime": fields["runtime"]}
+
+    return data
+
+# Function to check for overlapping times. Returns the list of conflicts (see windows.find_conflicts), empty if none
+# Checks the windows from the form together with the extra windows that write_schedule_to_file keeps
+def check_for_overlap(data):
+    return find_conflicts(form_windows(data))
+
+# Function to turn the form data into the full list of schedule windows it would save
+# Rows from the form replace the first window of each zone. Extra windows and weekday masks added by hand are kept
+def form_windows(data):
+    days_by_row = {}
+    extra_windows = []
+    for window in controller.schedule_windows:
+        if window[0] in days_by_row:
+            extra_windows.append(window)
+        else:
+            days_by_row[window[0]] = window[3]
+
+    windows = []
+    for row, times in data.items():
+        if row[:3] != "row":
+            continue
+        if times['start'] != "NULL" and times['stop'] != "NULL":
+            zone = int(row[3:])
+            days = times.get('days', days_by_row.get(zone, ALL_DAYS))  # only /api/schedule sets the days
+            windows.append((zone, time_to_minutes(times['start']), time_to_minutes(times['stop']), days))
+    return windows + extra_windows
+
+# Function to save the schedule from the form to flash (see schedule_store.py) and recompile the calendar
+async def write_schedule_to_file(data):
+    windows = form_windows(data)
+    if save_schedule(windows):
+        log.info("Schedule saved")
+        controller.schedule_modified = controller.board.clock.time()
+        # The schedule changed, so recompile the weekly calendar
+        if controller.mailbox is not None:
+            if not await controller.mailbox.post_async(CMD_SCHEDULE):  # core 1 owns the calendar
+                log.error("Core 1 is not taking commands, calendar not rebuilt")
+        else:
+            build_calendar(windows)
+    else:
+        log.info("Schedule unchanged, nothing written")
+
+# Function to return the schedule data shown in the form from a list of windows: the first window of every row
+def read_schedule_rows(windows):
+    schedule_data = {}
+    for zone, start, stop, days in windows:
+        if zone not in schedule_data:
+            schedule_data[zone] = {
+                'start_hour': start // 60,
+                'start_minute': start % 60,
+                'end_hour': stop // 60,
+                'end_minute': stop % 60,
+                'duration': window_minutes(start, stop),
+                'days': days
+            }
+    return schedule_data
+
+# The schedule form is sent as a run of chunks. Everything static is rendered once here, at import,
+# and only the time, the schedule rows and the running zone are filled in per request.
+# Its CSS and JavaScript are separate files the browser caches, see the static files section below
+FORM_HEAD = b"""HTTP/1.1 200 OK
+Content-Type: text/html; charset=utf-8
+Connection: close
+
+<!DOCTYPE html>
+<html>
+<head><title>Set Schedule</title>
+<link rel="stylesheet" href=\"""" + ASSETS[b"/static/form.css"][3].encode() + b"""\">
+</head>
+<body>
+<h1>Set Schedule</h1>
+<form method="POST" action="/change_time" onsubmit="return validateForm(event)">
+    <!-- Current time section -->
+    <div class="schedule-row">
+        <label>Current System Time: </label>
+        <input type="text" value=\""""
+FORM_AFTER_TIME = b"""\" readonly>
+        <label>Set Time: </label>
+        <input type="time" name="new_time" required>
+        <button type="submit" name="change_time">Change Time</button>
+    </div>
+</form>
+<hr>
+
+<form method="POST" action="/submit_schedule" onsubmit="return validateForm(event)">
+    <!-- Schedule Section -->
+"""
+FORM_AFTER_ROWS = b"""
+    <!-- Submit Button -->
+    <button type="submit" name="submit_schedule">Submit Schedule</button>
+    <p><i>NOTE: To preserve pump health and prevent overheating, the pump runs at most 2 minutes straight, then in pulses of about 20 s on and 20 s off, so a window longer than 2 minutes delivers little more than half its length in water, plan windows accordingly</i></p>
+    </form>
+
+    <hr>
+
+    <!-- Instant Test Section -->
+    <form method="POST" action="/instant_test" onsubmit="return validateForm(event)">
+    <div class="schedule-row">
+        <label for="zone">Instant Test - Select Zone: </label>
+        <select name="zone">
+            <option value="1">Zone 1</option>
+            <option value="2">Zone 2</option>
+            <option value="3">Zone 3</option>
+            <option value="4">Zone 4</option>
+            <option value="5">Zone 5</option>
+            <option value="6">Zone 6</option>
+            <option value="7">Zone 7</option>
+        </select>
+        <label for="runtime">Run Time (seconds): </label>
+        <input type="number" name="runtime" min="1" required>
+        <button type="submit" name="instant_test">Run Test</button>
+    </div>
+    </form>
+
+    <form method="POST" action="/cancel_run">
+    <div class="schedule-row">
+        <label>Running Now: </label>
+        <input type="text" value=\""""
+FORM_TAIL = b"""\" readonly>
+        <button type="submit" name="cancel_run">Stop Watering</button>
+        <a href="/status">Run queue</a>
+    </div>
+    </form>
+
+<script src=\"""" + ASSETS[b"/static/form.js"][3].encode() + b"""\"></script>
+
+</body>
+</html>
+"""
+
+# Rendered schedule rows, one chunk per row, and the schedule version they were rendered from
+form_rows_cache = []
+form_rows_version = -1
+
+# Function to render the schedule rows of the form. Cached until the schedule changes
+def render_schedule_rows():
+    global form_rows_cache, form_rows_version
+    if form_rows_version == controller.schedule_version:
+        return form_rows_cache
+    schedule_data = read_schedule_rows(controller.schedule_windows)
+    rows = []
+    # Generate 7 rows of start/stop time inputs with pre-filled values from schedule_data
+    for i in range(1, 8):
+        # Check if we have data for this row
+        if i in schedule_data:
+            start_hour = schedule_data[i]['start_hour']
+            start_minute = schedule_data[i]['start_minute']
+            end_hour = schedule_data[i]['end_hour']
+            end_minute = schedule_data[i]['end_minute']
+            start_time = f"{start_hour:02}:{start_minute:02}"  # Format time as HH:MM
+            end_time = f"{end_hour:02}:{end_minute:02}"      # Format time as HH:MM
+        else:
+            # If no data, default to NULL
+            start_time = "NULL"
+            end_time = "NULL"
+
+        # Group start and stop time fields on the same line using a flexbox layout
+        rows.append(f"""
+        <div class="schedule-row">
+            <label for="start{i}">Row {i} Start Time: </label>
+            <input type="time" name="start{i}" value="{start_time}" required>
+            <label for="stop{i}">Row {i} Stop Time: </label>
+            <input type="time" name="stop{i}" value="{end_time}" required>
+        </div>
+        """.encode())
+    form_rows_cache = rows
+    form_rows_version = controller.schedule_version
+    return rows
+
+# Function to generate the schedule form with pre-filled values, as a generator of chunks to send
+def generate_schedule_form():
+    # Get the current system time (hour and minute)
+    current_time = controller.board.clock.localtime()  # Get the current time in struct_time format
+    yield FORM_HEAD
+    yield "{:02}:{:02}".format(current_time[3], current_time[4]).encode()  # Format it as HH:MM
+    yield FORM_AFTER_TIME
+    for row in render_schedule_rows():
+        yield row
+    yield FORM_AFTER_ROWS
+    # Show which zone is watering right now
+    running = read_status() and status_rows[0] == STATUS_RUNNING
+    yield (f"Zone {status_rows[1]}" if running else "None").encode()
+    yield FORM_TAIL
+
+STATUS_HEAD = b"""HTTP/1.1 200 OK
+Content-Type: text/html; charset=utf-8
+Connection: close
+
+<!DOCTYPE html>
+<html>
+<head><title>Run Queue</title></head>
+<body>
+<h1>Run Queue</h1>
+<table border="1">
+<tr><th></th><th>Zone</th><th>Kind</th><th>Seconds left</th><th>Queued</th><th>Started</th><th>Finished</th></tr>
+"""
+STATUS_TOTALS_HEAD = b"""</table>
+<h2>Watering</h2>
+<table border="1">
+<tr><th>Zone</th><th>Today (min)</th><th>Last 7 days (min)</th></tr>
+"""
+STATUS_HISTORY_HEAD = b"""</table>
+<h2>Recent runs</h2>
+<table border="1">
+<tr><th>Started</th><th>Zone</th><th>Kind</th><th>Minutes</th></tr>
+"""
+STATUS_TAIL = b"""</table>
+<a href="/status">Refresh</a> <a href="/">Go back to Schedule Form</a>
+</body>
+</html>
+"""
+
+# Function to format a clock time for the status page as HH:MM:SS, "-" if there is none
+def format_clock(t):
+    if t is None:
+        return "-"
+    current_time = controller.board.clock.localtime(int(t))
+    return "{:02}:{:02}:{:02}".format(current_time[3], current_time[4], current_time[5])
+
+STATUS_NAMES = {STATUS_RUNNING: "Running", STATUS_QUEUED: "Queued", STATUS_DONE: "Done"}
+
+# Function to format how many seconds ago something happened as the clock time it happened at, "-" if it hasn't
+def format_age(now, age):
+    return "-" if age < 0 else format_clock(now - age)
+
+# Function to render status row row as a row of the status table
+def status_row(now, row):
+    i = row * STATUS_FIELDS
+    kind = PRIORITY_NAMES[status_rows[i + 3]]
+    if status_rows[i + 4] > 1:
+        kind += f" x{status_rows[i + 4]}"
+    return (f"<tr><td>{STATUS_NAMES[status_rows[i]]}</td><td>{status_rows[i + 1]}</td><td>{kind}</td><td>{status_rows[i + 2]}</td>"
+            f"<td>{format_age(now, status_rows[i + 5])}</td><td>{format_age(now, status_rows[i + 6])}</td>"
+            f"<td>{format_age(now, status_rows[i + 7])}</td></tr>\n").encode()
+
+# Runs of the history the status page lists
+STATUS_HISTORY_RUNS = 10
+
+# Function to format a clock time with its day for the history, e.g. "Tue 18 Mar 07:01"
+def format_day_time(t):
+    tm = controller.board.clock.localtime(t)
+    return f"{DAY_NAMES[tm[6]]} {tm[2]:02} {MONTH_NAMES[tm[1] - 1]} {tm[3]:02}:{tm[4]:02}"
+
+# Function to generate the status page: the running job, the queued ones and the last few runs,
+# then each zone's pump minutes today and over the week, and the latest runs from the history
+def generate_status_page():
+    rows = read_status()
+    now = controller.board.clock.time()
+    yield STATUS_HEAD
+    for row in range(rows):
+        yield status_row(now, row)
+    yield STATUS_TOTALS_HEAD
+    for zone in range(1, run_history.ZONES):
+        today, week = run_history.totals(zone, now)
+        yield f"<tr><td>{zone}</td><td>{today / 60:.1f}</td><td>{week / 60:.1f}</td></tr>\n".encode()
+    yield STATUS_HISTORY_HEAD
+    for zone, start, seconds, trigger in run_history.recent(STATUS_HISTORY_RUNS):
+        yield (f"<tr><td>{format_day_time(start)}</td><td>{zone}</td><td>{PRIORITY_NAMES.get(trigger, trigger)}</td>"
+               f"<td>{seconds / 60:.1f}</td></tr>\n").encode()
+    yield STATUS_TAIL
+
+# JSON API: /api/schedule (GET, PUT), /api/status (GET), /api/history (GET) and /api/run (POST, DELETE)
+# The GETs send an ETag and Last-Modified, and a poll that sends either back answers 304 with no body while
+# nothing changed. The schedule's ETag is schedule_store's version count plus the CRC of the saved schedule, so
+# it differs after a reboot too. The status ETag is weak: it changes when a run is queued, started or stopped,
+# not every second as the seconds left count down
+DAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+MONTH_NAMES = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+STATE_NAMES = {STATUS_RUNNING: "running", STATUS_QUEUED: "queued", STATUS_DONE: "done"}
+
+# Function to format a clock time as an HTTP date, e.g. "Tue, 18 Mar 2025 07:01:00 GMT"
+def http_date(t):
+    tm = controller.board.clock.localtime(int(t))
+    return f"{DAY_NAMES[tm[6]]}, {tm[2]:02} {MONTH_NAMES[tm[1] - 1]} {tm[0]} {tm[3]:02}:{tm[4]:02}:{tm[5]:02} GMT"
+
+# Function to build a JSON response. body is bytes, etag and modified (an HTTP date) are sent when given
+def json_response(status, body, etag=None, modified=None):
+    head = f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nConnection: close\r\n"
+    if etag is not None:
+        head += f"ETag: {etag}\r\nLast-Modified: {modified}\r\nCache-Control: no-cache\r\n"
+    return (head.encode() + b"\r\n", body)
+
+# Function to check if the client already has the current version: If-None-Match holds the ETag, or when there
+# is no If-None-Match, If-Modified-Since is the Last-Modified sent with it. Dates are compared as text, as they
+# only ever come from http_date, and the clock can be set back so "older than" means nothing here
+def still_current(if_none_match, if_modified_since, etag, modified):
+    if if_none_match is not None:
+        tag = etag[2:] if etag[:2] == "W/" else etag  # weak comparison, W/ or not
+        return if_none_match == b"*" or tag.encode() in if_none_match
+    return if_modified_since is not None and if_modified_since == modified.encode()
+
+# Function to answer a GET with body (a function returning the bytes), or with 304 if the client is up to date
+def conditional_get(if_none_match, if_modified_since, etag, modified, body):
+    if still_current(if_none_match, if_modified_since, etag, modified):
+        return json_response("304 Not Modified", b"", etag, modified)
+    return json_response("200 OK", body(), etag, modified)
+
+# Function to encode a JSON response body, without the spaces json.dumps puts in by default
+def to_json(obj):
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+# Function to decode a JSON request body that has to be an object
+def json_body(body):
+    data = json.loads(str(body, "utf-8"))
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    return data
+
+# Function to tell if a decoded JSON value is a whole number. true and false decode to bools, which are ints too
+def is_whole_number(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+# /api/schedule's body, cached until the saved schedule changes
+api_schedule_cache = b""
+api_schedule_version = -1
+
+# Function to render the saved schedule as JSON, in the same rows as /api/schedule takes
+def render_api_schedule():
+    global api_schedule_cache, api_schedule_version
+    if api_schedule_version != schedule_store.version:
+        rows = {}
+        for zone, row in read_schedule_rows(schedule_store.saved_windows).items():
+            rows[f"row{zone}"] = {"start": f"{row['start_hour']:02}:{row['start_minute']:02}",
+                                  "stop": f"{row['end_hour']:02}:{row['end_minute']:02}", "days": row['days']}
+        api_schedule_cache = to_json(rows)
+        api_schedule_version = schedule_store.version
+    return api_schedule_cache
+
+# Function to answer GET /api/schedule
+def api_get_schedule(if_none_match, if_modified_since):
+    etag = f'"{schedule_store.version}-{schedule_store.saved_crc:08x}"'
+    return conditional_get(if_none_match, if_modified_since, etag, http_date(controller.schedule_modified), render_api_schedule)
+
+# Function to answer PUT /api/schedule. Takes the rows GET returns: {"row1": {"start": "07:00", "stop": "07:10"}, ...}
+# with "days" (a weekday bitmask, bit 0 = Monday) optional. Like the form, a row that is left out is switched off
+async def api_put_schedule(body):
+    rows = json_body(body)
+    data = {}
+    for i in range(1, 8):
+        row = rows.get(f"row{i}")
+        if row is None:
+            data[f"row{i}"] = {"start": "NULL", "stop": "NULL"}
+            continue
+        if not isinstance(row, dict) or not isinstance(row.get("start"), str) or not isinstance(row.get("stop"), str):
+            raise ValueError(f"row{i} needs a start and a stop time as HH:MM")
+        data[f"row{i}"] = {"start": row["start"], "stop": row["stop"]}
+        if "days" in row:
+            if not is_whole_number(row["days"]) or not 0 < row["days"] <= ALL_DAYS:
+                raise ValueError(f"row{i} days must be a weekday bitmask from 1 to {ALL_DAYS}")
+            data[f"row{i}"]["days"] = row["days"]
+
+    conflicts = check_for_overlap(data)
+    if conflicts:
+        return json_response("409 Conflict", to_json({"conflicts": [describe_conflict(c) for c in conflicts]}))
+    await write_schedule_to_file(data)
+    return api_get_schedule(None, None)
+
+# Function to render status row row as a JSON object. Times are seconds ago, null for not yet
+def api_status_row(row):
+    i = row * STATUS_FIELDS
+    return {"state": STATE_NAMES[status_rows[i]], "zone": status_rows[i + 1], "left": status_rows[i + 2],
+            "kind": PRIORITY_NAMES[status_rows[i + 3]], "merged": status_rows[i + 4],
+            "queued": status_rows[i + 5], "started": None if status_rows[i + 6] < 0 else status_rows[i + 6],
+            "finished": None if status_rows[i + 7] < 0 else status_rows[i + 7]}
+
+# Function to answer GET /api/status: the running run, the queued ones and the last few, as on /status
+def api_get_status(if_none_match, if_modified_since):
+    rows = read_status()
+    etag = f'W/"{status_info[0]}-{status_info[1]}"'
+    return conditional_get(if_none_match, if_modified_since, etag, http_date(status_info[1]),
+                           lambda: to_json({"runs": [api_status_row(row) for row in range(rows)]}))
+
+# Function to answer GET /api/history: the runs in the history, newest first, and each zone's pump seconds today
+# and over the last 7 days. The ETag changes with every run recorded and at midnight, when today's totals start over
+def api_get_history(if_none_match, if_modified_since):
+    now = int(controller.board.clock.time())
+    today = now // run_history.SECONDS_PER_DAY
+    etag = f'W/"{run_history.count}-{run_history.modified}-{today}"'
+    modified = max(run_history.modified, today * run_history.SECONDS_PER_DAY)
+
+    def body():
+        runs = []
+        for zone, start, seconds, trigger in run_history.recent():
+            tm = controller.board.clock.localtime(start)
+            runs.append({"zone": zone, "start": f"{tm[0]}-{tm[1]:02}-{tm[2]:02}T{tm[3]:02}:{tm[4]:02}:{tm[5]:02}",
+                         "seconds": seconds, "kind": PRIORITY_NAMES.get(trigger, trigger)})
+        totals = {}
+        for zone in range(1, run_history.ZONES):
+            day, week = run_history.totals(zone, now)
+            totals[f"zone{zone}"] = {"today": day, "week": week}
+        return to_json({"runs": runs, "totals": totals})
+    return conditional_get(if_none_match, if_modified_since, etag, http_date(modified), body)
+
+# Function to answer POST /api/run: {"zone": 3, "seconds": 60} queues an instant test, like the form's
+def api_start_run(body):
+    run = json_body(body)
+    zone = run.get("zone")
+    seconds = run.get("seconds")
+    if not is_whole_number(zone) or not is_whole_number(seconds):
+        raise ValueError("zone and seconds must be whole numbers")
+    log.info(f"Testing zone {zone} for {seconds} seconds")
+    if start_zone_run(zone, seconds) is None:
+        raise RequestError(503, "Run queue full, try again later")
+    return json_response("202 Accepted", to_json({"zone": zone, "seconds": seconds}))
+
+# Static files: the form's CSS and JavaScript, stored gzipped on flash by tools/build_assets.py and listed in
+# static_assets.py. They are streamed as they are with Content-Encoding: gzip, and as their links carry a hash
+# of their contents (see FORM_HEAD) browsers may keep them for a year
+STATIC_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Function to answer a request for a static file. buf is the client's request buffer, free again once the
+# request is parsed, and the file is read through it in chunks
+def static_response(asset, buf):
+    name, content_type, size, link = asset
+    try:
+        f = open(name, "rb")
+    except OSError:
+        raise RequestError(404, f"{name} is missing, copy piPicoCode/static to the Pico")
+    return generate_static(f, content_type, size, buf)
+
+# Function to stream an open static file as a generator of chunks
+def generate_static(f, content_type, size, buf):
+    mv = memoryview(buf)
+    with f:
+        yield (f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\nContent-Encoding: gzip\r\n"
+               f"Content-Length: {size}\r\nCache-Control: {STATIC_CACHE_CONTROL}\r\nConnection: close\r\n\r\n").encode()
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            yield mv[:n]
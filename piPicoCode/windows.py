@@ -0,0 +1,68 @@
+# Schedule windows and the validator that checks them
+# A window is (zone, start minute of day, stop minute of day, days): days is a weekday bitmask (bit 0 = Monday)
+# and a window whose stop is before its start runs on past midnight into the next day
+
+MINUTES_PER_DAY = 1440
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+ALL_DAYS = 0x7F
+
+# Function to convert time "HH:MM" to minutes of the day
+def time_to_minutes(time_str):
+    hours, minutes = map(int, time_str.split(":"))
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"Bad time {time_str}")
+    return hours * 60 + minutes
+
+# Function to return how many minutes a window lasts, wrapping past midnight. 0 means the window is off
+def window_minutes(start, stop):
+    return (stop - start) % MINUTES_PER_DAY
+
+# Function to lay every window out on the week as (start, end, window index) in minutes of the week, sorted by start
+# A window is repeated for each of its days. One that runs past Sunday midnight is also added a week earlier
+# (starting before Monday 00:00) so it still meets the Monday windows it overlaps
+def week_intervals(windows):
+    intervals = []
+    for index, (zone, start, stop, days) in enumerate(windows):
+        length = window_minutes(start, stop)
+        if length == 0:
+            continue
+        for day in range(7):
+            if days & (1 << day):
+                first = day * MINUTES_PER_DAY + start
+                end = first + length
+                intervals.append((first, end, index))
+                if end > MINUTES_PER_WEEK:
+                    intervals.append((first - MINUTES_PER_WEEK, end - MINUTES_PER_WEEK, index))
+    intervals.sort()
+    return intervals
+
+# Function to find every pair of windows that water at the same time, in one sweep over the sorted week
+# Only the windows still open at each start are compared, so a valid schedule costs one sort and one pass
+# Returns a list of conflicts, empty when the schedule is fine. Each conflict is a dict:
+#   rows: (zone, zone) of the two windows, windows: their indexes in the list,
+#   minutes: the longest overlap in minutes, days: bitmask of the weekdays the overlap starts on
+def find_conflicts(windows):
+    conflicts = {}
+    open_windows = []  # (end, window index) of the windows still running at the current start
+    for start, end, index in week_intervals(windows):
+        open_windows = [(open_end, other) for open_end, other in open_windows if open_end > start]
+        for open_end, other in open_windows:
+            key = (other, index) if other < index else (index, other)
+            minutes = min(end, open_end) - start
+            day_bit = 1 << (start % MINUTES_PER_WEEK // MINUTES_PER_DAY)
+            conflict = conflicts.get(key)
+            if conflict is None:
+                conflicts[key] = {"rows": (windows[key[0]][0], windows[key[1]][0]), "windows": key,
+                                  "minutes": minutes, "days": day_bit}
+            else:
+                conflict["minutes"] = max(conflict["minutes"], minutes)
+                conflict["days"] |= day_bit
+        open_windows.append((end, index))
+    return list(conflicts.values())
+
+# Function to describe a conflict for people, e.g. "Row 1 and row 2 overlap by 15 minutes"
+def describe_conflict(conflict):
+    row_a, row_b = conflict["rows"]
+    if row_a == row_b:
+        return f"Row {row_a} has two windows that overlap by {conflict['minutes']} minutes"
+    return f"Row {row_a} and row {row_b} overlap by {conflict['minutes']} minutes"
@@ -0,0 +1,8 @@
+# The Pico code imports its modules by bare name, as it does from the root of the Pico's flash, and the host tools
+# import it the same way
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+sys.path.insert(0, os.path.join(ROOT, "piPicoCode"))
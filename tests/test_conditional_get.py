@@ -0,0 +1,73 @@
+import pytest
+
+import controller
+import schedule_store
+import simulator
+import web
+from windows import ALL_DAYS
+
+
+def header(head, name):
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(name.lower() + b":"):
+            return line.split(b":", 1)[1].strip()
+    return None
+
+
+@pytest.fixture
+def saved(tmp_path, monkeypatch):
+    # A saved schedule on the simulated board
+    monkeypatch.chdir(tmp_path)
+    loop = simulator.VirtualTimeLoop()
+    monkeypatch.setattr(controller, "board", simulator.SimBoard(loop))
+    monkeypatch.setattr(schedule_store, "saved_windows", None)
+    schedule_store.save_schedule([(1, 420, 430, ALL_DAYS)])
+    monkeypatch.setattr(controller, "schedule_modified", controller.board.clock.time())
+    yield
+    loop.close()
+
+
+def test_etag_match():
+    assert web.still_current(b'"3-abc"', None, '"3-abc"', "date")
+    assert web.still_current(b'"1-x", "3-abc"', None, '"3-abc"', "date")
+    assert web.still_current(b"*", None, '"3-abc"', "date")
+    assert not web.still_current(b'"2-abc"', None, '"3-abc"', "date")
+
+
+def test_weak_etag_match():
+    assert web.still_current(b'W/"5-100"', None, 'W/"5-100"', "date")
+    assert web.still_current(b'"5-100"', None, 'W/"5-100"', "date")
+    assert not web.still_current(b'W/"5-101"', None, 'W/"5-100"', "date")
+
+
+def test_if_none_match_wins_over_if_modified_since():
+    assert not web.still_current(b'"2-abc"', b"date", '"3-abc"', "date")
+
+
+def test_if_modified_since():
+    assert web.still_current(None, b"Mon, 17 Mar 2025 00:00:00 GMT", '"3-abc"', "Mon, 17 Mar 2025 00:00:00 GMT")
+    assert not web.still_current(None, b"Mon, 17 Mar 2025 00:00:01 GMT", '"3-abc"', "Mon, 17 Mar 2025 00:00:00 GMT")
+    assert not web.still_current(None, None, '"3-abc"', "Mon, 17 Mar 2025 00:00:00 GMT")
+
+
+def test_304_skips_the_body():
+    def body():
+        raise AssertionError("body rendered for a 304")
+
+    head, answer = web.conditional_get(b'"1-a"', None, '"1-a"', "date", body)
+    assert head.startswith(b"HTTP/1.1 304 Not Modified\r\n") and answer == b""
+    assert header(head, b"ETag") == b'"1-a"'
+
+
+def test_schedule_304_until_it_changes(saved):
+    head, body = web.api_get_schedule(None, None)
+    assert head.startswith(b"HTTP/1.1 200 OK\r\n") and b'"row1"' in body
+    etag = header(head, b"ETag")
+    modified = header(head, b"Last-Modified")
+    assert web.api_get_schedule(etag, None)[0].startswith(b"HTTP/1.1 304 ")
+    assert web.api_get_schedule(None, modified)[0].startswith(b"HTTP/1.1 304 ")
+
+    schedule_store.save_schedule([(1, 420, 440, ALL_DAYS)])
+    head, body = web.api_get_schedule(etag, None)
+    assert head.startswith(b"HTTP/1.1 200 OK\r\n") and b'"07:20"' in body
+    assert header(head, b"ETag") != etag
@@ -0,0 +1,9 @@
+import fleet
+from windows import ALL_DAYS
+
+
+def test_saved_rows_match_what_the_unit_echoes():
+    pushed = {"row1": {"start": "7:00", "stop": "07:10"}, "row3": {"start": "23:50", "stop": "0:20", "days": 65},
+              "row9": {"start": "01:00", "stop": "02:00"}}
+    assert fleet.saved_rows(pushed) == {"row1": {"start": "07:00", "stop": "07:10", "days": ALL_DAYS},
+                                        "row3": {"start": "23:50", "stop": "00:20", "days": 65}}
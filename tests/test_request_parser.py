@@ -0,0 +1,25 @@
+from request_parser import parse_form
+
+
+def test_plus_is_a_space():
+    assert parse_form(b"zone=1&name=back+garden") == {"zone": "1", "name": "back garden"}
+
+
+def test_percent_escapes():
+    assert parse_form(b"start1=07%3A30&x=%2b%25%26%3D") == {"start1": "07:30", "x": "+%&="}
+
+
+def test_utf8_escapes():
+    assert parse_form(b"name=%C3%A9t%C3%A9") == {"name": "été"}
+
+
+def test_broken_escapes_are_kept():
+    assert parse_form(b"a=%zz&b=50%&c=%4") == {"a": "%zz", "b": "50%", "c": "%4"}
+
+
+def test_names_without_values():
+    assert parse_form(b"cancel_run&x=&&") == {"cancel_run": "", "x": ""}
+
+
+def test_empty_body():
+    assert parse_form(b"") == {}
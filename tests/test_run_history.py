@@ -0,0 +1,105 @@
+import importlib
+import os
+
+import pytest
+
+import run_history as run_history_module
+from run_history import RECORD_SIZE, SECONDS_PER_DAY
+from run_queue import PRIORITY_SCHEDULE, PRIORITY_TEST
+
+DAY = 20000 * SECONDS_PER_DAY  # midnight starting some day
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    # A fresh history with its files in an empty directory
+    monkeypatch.chdir(tmp_path)
+    return importlib.reload(run_history_module)
+
+
+def test_ring_keeps_the_newest(history):
+    for i in range(history.HISTORY_SIZE + 5):
+        history.add(1 + i % 3, DAY + i * 60, 10 + i, PRIORITY_SCHEDULE, DAY + i * 60 + 30)
+    runs = history.recent()
+    assert len(runs) == history.HISTORY_SIZE
+    newest = history.HISTORY_SIZE + 4
+    assert runs[0] == (1 + newest % 3, DAY + newest * 60, 10 + newest, PRIORITY_SCHEDULE)
+    assert runs[-1][1] == DAY + 5 * 60
+    assert history.recent(2) == runs[:2]
+    assert history.count == history.HISTORY_SIZE + 5
+
+
+def test_long_runs_are_capped(history):
+    history.add(2, DAY, 100000, PRIORITY_TEST, DAY)
+    assert history.recent(1) == [(2, DAY, history.MAX_SECONDS, PRIORITY_TEST)]
+
+
+def test_day_and_week_totals(history):
+    history.add(1, DAY - 7 * SECONDS_PER_DAY, 1000, PRIORITY_SCHEDULE, DAY)  # a week ago, not in the week
+    history.add(1, DAY - 2 * SECONDS_PER_DAY, 30, PRIORITY_SCHEDULE, DAY)
+    history.add(1, DAY + 100, 60, PRIORITY_SCHEDULE, DAY + 200)
+    history.add(2, DAY + 300, 45, PRIORITY_TEST, DAY + 400)
+    assert history.totals(1, DAY + 500) == (60, 90)
+    assert history.totals(2, DAY + 500) == (45, 45)
+    # a day later, today's totals start at 0 again
+    assert history.totals(1, DAY + SECONDS_PER_DAY) == (0, 90)
+
+
+def test_clock_set_back_starts_the_totals_over(history):
+    # Setting the time always sets the same date, so the clock goes back to days the table already holds
+    history.add(1, DAY + SECONDS_PER_DAY, 100, PRIORITY_SCHEDULE, DAY + SECONDS_PER_DAY)
+    history.add(1, DAY + 7 * SECONDS_PER_DAY, 200, PRIORITY_SCHEDULE, DAY + 7 * SECONDS_PER_DAY)
+    history.add(1, DAY, 300, PRIORITY_SCHEDULE, DAY)  # set back a week
+    assert history.totals(1, DAY + 100) == (300, 300)
+    # the next day's run isn't added to the seconds that day had before the clock went back
+    history.add(1, DAY + SECONDS_PER_DAY, 50, PRIORITY_SCHEDULE, DAY + SECONDS_PER_DAY)
+    assert history.totals(1, DAY + SECONDS_PER_DAY + 100) == (50, 350)
+
+
+def test_flush_in_batches(history):
+    for i in range(history.FLUSH_BATCH - 1):
+        history.add(1, DAY + i, 10, PRIORITY_SCHEDULE, DAY + i)
+    assert not history.flush_due(DAY + 10)
+    assert history.flush_due(DAY + history.FLUSH_AFTER_S)  # the oldest waited long enough
+    history.add(2, DAY + 50, 10, PRIORITY_SCHEDULE, DAY + 50)
+    assert history.flush_due(DAY + 50)
+    history.flush()
+    assert history.pending == 0 and not history.flush_due(DAY + 10 ** 6)
+    assert os.path.getsize(history.HISTORY_FILE) == history.FLUSH_BATCH * RECORD_SIZE
+
+
+def test_full_file_becomes_the_old_one(history, monkeypatch):
+    monkeypatch.setattr(history, "FILE_RECORDS", 4)
+    for i in range(6):
+        history.add(1, DAY + i, 10, PRIORITY_SCHEDULE, DAY + i)
+        history.flush()
+    assert os.path.getsize(history.OLD_FILE) == 4 * RECORD_SIZE
+    assert os.path.getsize(history.HISTORY_FILE) == 2 * RECORD_SIZE
+
+
+def test_load_after_boot(history):
+    history.add(3, DAY, 120, PRIORITY_SCHEDULE, DAY)
+    history.add(4, DAY + 600, 60, PRIORITY_TEST, DAY + 600)
+    history.flush()
+    history = importlib.reload(history)
+    history.load()
+    assert history.recent() == [(4, DAY + 600, 60, PRIORITY_TEST), (3, DAY, 120, PRIORITY_SCHEDULE)]
+    assert history.totals(3, DAY + 700) == (120, 120)
+    assert history.pending == 0  # loaded runs are on flash already
+
+
+def test_load_drops_a_torn_record(history):
+    history.add(3, DAY, 120, PRIORITY_SCHEDULE, DAY)
+    history.flush()
+    with open(history.HISTORY_FILE, "ab") as f:
+        f.write(b"\x01\x02\x03")  # power cut halfway through the next append
+    history = importlib.reload(history)
+    history.load()
+    assert history.recent() == [(3, DAY, 120, PRIORITY_SCHEDULE)]
+    assert os.path.getsize(history.HISTORY_FILE) == RECORD_SIZE
+    # the next append lines up with the records again
+    history.add(5, DAY + 60, 30, PRIORITY_TEST, DAY + 60)
+    history.flush()
+    history = importlib.reload(history)
+    history.load()
+    assert [run[0] for run in history.recent()] == [5, 3]
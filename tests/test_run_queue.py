@@ -0,0 +1,51 @@
+from run_queue import PRIORITY_SCHEDULE, PRIORITY_TEST, RunJob, RunQueue
+
+NOW = 1000
+
+
+def queue_of(*jobs):
+    queue = RunQueue()
+    for job in jobs:
+        assert queue.add(job) is job
+    return queue
+
+
+def test_tests_go_before_scheduled_runs():
+    queue = queue_of(RunJob(1, 60, PRIORITY_SCHEDULE, NOW), RunJob(5, 60, PRIORITY_TEST, NOW))
+    assert queue.next_job(1, NOW).zone == 5
+    assert queue.next_job(1, NOW).zone == 1
+    assert queue.next_job(1, NOW) is None
+
+
+def test_nearest_zone_first():
+    queue = queue_of(RunJob(1, 60, PRIORITY_SCHEDULE, NOW), RunJob(4, 60, PRIORITY_SCHEDULE, NOW))
+    assert queue.next_job(3, NOW).zone == 4
+
+
+def test_oldest_pulse_first_when_the_moves_are_free():
+    zone2 = RunJob(2, 60, PRIORITY_SCHEDULE, NOW)
+    zone3 = RunJob(3, 60, PRIORITY_SCHEDULE, NOW)
+    zone2.last_pulse = NOW - 10
+    zone3.last_pulse = NOW - 50
+    queue = queue_of(zone2, zone3)
+    assert queue.next_job(1, NOW, free_travel=10).zone == 3
+
+
+def test_run_about_to_miss_its_window_goes_first():
+    # Zone 2 is next to the arm, but a pulse on it first would leave zone 7 no time before its window ends
+    queue = queue_of(RunJob(2, 600, PRIORITY_SCHEDULE, NOW), RunJob(7, 60, PRIORITY_SCHEDULE, NOW, deadline=NOW + 70))
+    assert queue.next_job(1, NOW, pulse=60).zone == 7
+    assert queue.next_job(7, NOW, pulse=60).zone == 2
+
+
+def test_window_over_drops_the_run():
+    queue = queue_of(RunJob(1, 60, PRIORITY_SCHEDULE, NOW, deadline=NOW - 1))
+    assert queue.next_job(1, NOW) is None
+    assert queue.jobs == []
+
+
+def test_run_for_a_queued_zone_is_merged():
+    queue = RunQueue()
+    first = queue.add(RunJob(3, 60, PRIORITY_TEST, NOW))
+    assert queue.add(RunJob(3, 30, PRIORITY_TEST, NOW + 5)) is first
+    assert (first.seconds, first.merged, len(queue.jobs)) == (90, 2, 1)
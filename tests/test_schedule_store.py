@@ -0,0 +1,57 @@
+import pytest
+
+import schedule_store
+from schedule_store import HEADER_SIZE, pack_schedule, unpack_schedule
+from windows import ALL_DAYS
+
+WINDOWS = [(1, 420, 430, ALL_DAYS), (2, 1430, 20, 0x41), (7, 0, 1439, 1)]
+
+
+def test_round_trip():
+    assert unpack_schedule(pack_schedule(WINDOWS)) == WINDOWS
+
+
+def test_crc_matches_zlib():
+    data = bytes(range(256)) * 3
+    assert schedule_store.crc32_fallback(data) == schedule_store.crc32(data)
+
+
+def test_damaged_record():
+    data = pack_schedule(WINDOWS)
+    data[HEADER_SIZE + 1] ^= 0x01
+    with pytest.raises(ValueError, match="damaged"):
+        unpack_schedule(data)
+
+
+def test_cut_short():
+    data = pack_schedule(WINDOWS)
+    with pytest.raises(ValueError, match="damaged"):
+        unpack_schedule(data[:-1])
+    with pytest.raises(ValueError, match="too short"):
+        unpack_schedule(data[:HEADER_SIZE - 1])
+
+
+def test_not_a_schedule_file():
+    data = pack_schedule(WINDOWS)
+    data[0:4] = b"XXXX"
+    with pytest.raises(ValueError, match="not a schedule file"):
+        unpack_schedule(data)
+
+
+def test_damaged_file_falls_back_to_schedule_txt(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(schedule_store, "saved_windows", None)
+    data = pack_schedule(WINDOWS)
+    data[-1] ^= 0xFF
+    (tmp_path / schedule_store.SCHEDULE_FILE).write_bytes(bytes(data))
+    (tmp_path / schedule_store.TEXT_FILE).write_text("row1, 7, 0, 7, 10, 10\nrow2, 8, 0, 8, 5, 5, 31\n")
+    assert schedule_store.load_schedule() == [(1, 420, 430, ALL_DAYS), (2, 480, 485, 31)]
+    # and it was saved again, undamaged
+    assert unpack_schedule((tmp_path / schedule_store.SCHEDULE_FILE).read_bytes()) == [(1, 420, 430, ALL_DAYS),
+                                                                                          (2, 480, 485, 31)]
+
+
+def test_nothing_on_flash_gives_the_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(schedule_store, "saved_windows", None)
+    assert schedule_store.load_schedule() == schedule_store.DEFAULT_WINDOWS
@@ -0,0 +1,90 @@
+import importlib
+
+import pytest
+
+import controller
+import simulator
+from run_queue import PRIORITY_SCHEDULE
+from windows import ALL_DAYS
+
+SEVEN = 7 * 3600  # 07:00 on Monday, seconds after the simulated clock starts
+
+
+@pytest.fixture
+def sched():
+    # The scheduler on the simulated board, its clock moved by hand (the loop never runs)
+    loop = simulator.VirtualTimeLoop()
+    module = importlib.reload(controller)
+    module.board = simulator.SimBoard(loop)
+    module.build_calendar([(2, 420, 430, ALL_DAYS)])
+    yield loop, module
+    loop.close()
+
+
+def at(loop, seconds):
+    loop.virtual_time = seconds
+
+
+def test_start_fires_once(sched):
+    loop, controller = sched
+    at(loop, SEVEN - 60)
+    controller.plan_schedule()
+    assert controller.check_schedule() == 60
+    assert controller.run_queue.jobs == []
+    at(loop, SEVEN + 30)
+    controller.check_schedule()
+    at(loop, SEVEN + 40)
+    controller.check_schedule()
+    [job] = controller.run_queue.jobs
+    assert (job.zone, job.seconds, job.priority, job.merged) == (2, 570, PRIORITY_SCHEDULE, 1)
+    assert job.deadline == simulator.START_TIME + SEVEN + 600
+
+
+def test_clock_set_back_over_a_start_does_not_fire_it_again(sched):
+    loop, controller = sched
+    at(loop, SEVEN - 60)
+    controller.plan_schedule()
+    at(loop, SEVEN + 30)
+    controller.check_schedule()
+    controller.board.clock.offset -= 120  # back to 06:58:30
+    controller.plan_schedule()
+    at(loop, SEVEN + 150)  # the clock says 07:00:30 again
+    controller.check_schedule()
+    assert len(controller.run_queue.jobs) == 1 and controller.run_queue.jobs[0].merged == 1
+
+
+def test_start_missed_by_a_little_still_runs(sched):
+    # The clock set forward past a start, or a check that came late, within CATCH_UP_SECONDS
+    loop, controller = sched
+    at(loop, SEVEN + 90)
+    controller.plan_schedule()
+    controller.check_schedule()
+    [job] = controller.run_queue.jobs
+    assert (job.zone, job.seconds) == (2, 510)
+
+
+def test_start_missed_by_more_is_skipped(sched):
+    loop, controller = sched
+    at(loop, SEVEN + controller.CATCH_UP_SECONDS + 60)
+    controller.plan_schedule()
+    controller.check_schedule()
+    assert controller.run_queue.jobs == []
+    # and planned for the next day instead
+    assert controller.seconds_to_next_start() == 86400 - controller.CATCH_UP_SECONDS - 60
+
+    at(loop, SEVEN - 60)
+    controller.plan_schedule()
+    at(loop, SEVEN + 300)  # no check between 06:59 and 07:05
+    controller.check_schedule()
+    assert controller.run_queue.jobs == []
+
+
+def test_window_removed_from_the_schedule_is_forgotten(sched):
+    loop, controller = sched
+    at(loop, SEVEN + 30)
+    controller.plan_schedule()
+    controller.check_schedule()
+    assert controller.last_fired
+    controller.build_calendar([(3, 600, 610, ALL_DAYS)])
+    controller.plan_schedule()
+    assert controller.last_fired == {}
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+import controller
+import simulator
+import web
+
+
+def serve(monkeypatch, client):
+    # Runs client(port) against web.handle_client on a local port, on the simulated board in real time
+    async def run():
+        monkeypatch.setattr(controller, "board", simulator.SimBoard(None))
+        controller.board.clock = simulator.SimClock(asyncio.get_running_loop())
+        server = await asyncio.start_server(web.handle_client, "127.0.0.1", 0)
+        try:
+            return await client(server.sockets[0].getsockname()[1])
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    return asyncio.run(run())
+
+
+# Function to send a request in pieces a little apart, the way it arrives over Wi-Fi, and return the status
+async def send(port, *pieces):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        for piece in pieces:
+            writer.write(piece)
+            await writer.drain()
+            await asyncio.sleep(0.01)
+        answer = await asyncio.wait_for(reader.read(), 5)
+    finally:
+        writer.close()
+    return answer[9:12]
+
+
+@pytest.fixture(autouse=True)
+def quiet(monkeypatch):
+    monkeypatch.setattr(web.log, "level", web.log.ERROR)
+    monkeypatch.setattr(web, "buffer_freed", asyncio.Event())  # asyncio.run makes a new loop for every test
+
+
+def test_body_too_large_gets_413(monkeypatch):
+    body = b"x" * (2 * web.REQUEST_BUFFER_SIZE)
+    head = f"POST /submit_schedule HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+    pieces = [body[i:i + 1024] for i in range(0, len(body), 1024)]
+    assert serve(monkeypatch, lambda port: send(port, head, *pieces)) == b"413"
+
+
+def test_head_too_large_gets_413(monkeypatch):
+    head = b"GET / HTTP/1.1\r\n" + b"X-Filler: " + b"x" * (2 * web.REQUEST_BUFFER_SIZE) + b"\r\n\r\n"
+    assert serve(monkeypatch, lambda port: send(port, head[:3000], head[3000:])) == b"413"
+
+
+def test_bad_request_line_gets_400(monkeypatch):
+    assert serve(monkeypatch, lambda port: send(port, b"NONSENSE\r\n\r\n", b"more that isn't read")) == b"400"
+
+
+def test_busy_gets_503(monkeypatch):
+    monkeypatch.setattr(web, "request_buffers", [])
+    monkeypatch.setattr(web, "BUFFER_WAIT_MS", 20)
+    assert serve(monkeypatch, lambda port: send(port, b"GET / HTTP/1.1\r\nHost: pico\r\n\r\n")) == b"503"
+
+
+def test_busy_gets_503_when_the_client_sends_nothing(monkeypatch):
+    monkeypatch.setattr(web, "request_buffers", [])
+    monkeypatch.setattr(web, "BUFFER_WAIT_MS", 20)
+    assert serve(monkeypatch, lambda port: send(port, b"")) == b"503"
@@ -0,0 +1,34 @@
+from windows import ALL_DAYS, find_conflicts
+
+MONDAY = 1 << 0
+TUESDAY = 1 << 1
+SUNDAY = 1 << 6
+
+
+def test_back_to_back_windows_are_fine():
+    assert find_conflicts([(1, 420, 430, ALL_DAYS), (2, 430, 440, ALL_DAYS)]) == []
+
+
+def test_same_time_on_other_days_is_fine():
+    assert find_conflicts([(1, 420, 480, MONDAY), (2, 420, 480, TUESDAY)]) == []
+
+
+def test_overlap_past_midnight():
+    # 23:50 to 00:20 meets 00:10 to 00:30 every day
+    conflicts = find_conflicts([(1, 23 * 60 + 50, 20, ALL_DAYS), (2, 10, 30, ALL_DAYS)])
+    assert conflicts == [{"rows": (1, 2), "windows": (0, 1), "minutes": 10, "days": ALL_DAYS}]
+
+
+def test_overlap_past_sunday_midnight():
+    # Sunday 23:30 to Monday 00:30 meets Monday 00:00 to 00:15
+    conflicts = find_conflicts([(1, 23 * 60 + 30, 30, SUNDAY), (2, 0, 15, MONDAY)])
+    assert conflicts == [{"rows": (1, 2), "windows": (0, 1), "minutes": 15, "days": MONDAY}]
+
+
+def test_sunday_window_misses_tuesday():
+    assert find_conflicts([(1, 23 * 60 + 30, 30, SUNDAY), (2, 0, 15, TUESDAY)]) == []
+
+
+def test_two_windows_of_one_row():
+    conflicts = find_conflicts([(3, 420, 450, ALL_DAYS), (3, 440, 460, MONDAY)])
+    assert conflicts == [{"rows": (3, 3), "windows": (0, 1), "minutes": 10, "days": MONDAY}]
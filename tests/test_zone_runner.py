@@ -0,0 +1,49 @@
+import asyncio
+import importlib
+
+import pytest
+
+import controller
+import simulator
+from run_queue import PRIORITY_SCHEDULE
+
+
+@pytest.fixture
+def sim(tmp_path, monkeypatch):
+    # The controller on the simulated board, on virtual time, with no schedule windows due for hours
+    monkeypatch.chdir(tmp_path)
+    loop = simulator.VirtualTimeLoop()
+    asyncio.set_event_loop(loop)
+    module = importlib.reload(controller)
+    board = simulator.SimBoard(loop, keep_events=True)
+    module.board = board
+
+    async def start():
+        module.start_controller()
+
+    loop.run_until_complete(start())
+    yield loop, module, board
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    results = loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    asyncio.set_event_loop(None)
+    loop.close()
+    failed = [result for result in results if isinstance(result, AssertionError)]
+    assert not failed, failed
+
+
+def test_preempted_while_the_arm_moves(sim):
+    # A test run that preempts a scheduled run while the arm is still on its way waits for the arm,
+    # which has the rest of the old move to finish first
+    loop, controller, board = sim
+    loop.run_until_complete(asyncio.sleep(60))  # the arm parks at zone 0
+    assert board.selector.position == 0
+    controller.queue_zone_run(7, 60, PRIORITY_SCHEDULE, None)
+    loop.run_until_complete(asyncio.sleep(0.1))
+    controller.start_zone_run(6, 30)
+    loop.run_until_complete(asyncio.sleep(10))
+    assert board.pump.zone == 6 and board.pump.running_since is not None
+    sent = [t for t, what, zone in board.events if what == "selector" and zone == 7][0]
+    pump_on = [t for t, what, zone in board.events if what == "pump on"][0]
+    assert pump_on - sent >= simulator.hal.selector_travel_time(0, 7)
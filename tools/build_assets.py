@@ -0,0 +1,75 @@
+# Build step for the web page's static files
+# The CSS and JavaScript of the schedule form live in web/ and are sent to browsers as separate files, so they are
+# cached instead of coming along with every page. This gzips them into piPicoCode/static/ (the Pico streams them
+# as they are, with Content-Encoding: gzip) and writes piPicoCode/static_assets.py, the table web.py serves them
+# from. Each file's link carries a hash of its contents, so browsers can cache it for good and still pick up a
+# rebuilt one. Run it after editing anything in web/ and copy static/ and static_assets.py to the Pico:
+#
+#   python tools/build_assets.py
+#   mpremote cp -r piPicoCode/static : + cp piPicoCode/static_assets.py :
+import binascii
+import gzip
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEB_DIR = os.path.join(ROOT, "web")
+PICO_DIR = os.path.join(ROOT, "piPicoCode")
+STATIC_DIR = os.path.join(PICO_DIR, "static")
+
+# Files to build: name in web/ and the Content-Type it is sent with
+ASSETS = [("form.css", "text/css"), ("form.js", "text/javascript")]
+
+MANIFEST_HEAD = """# Generated by tools/build_assets.py from web/, don't edit. Rebuild after changing anything in web/
+# URL path: (gzipped file on flash, Content-Type, size in bytes, link to it with its version)
+ASSETS = {
+"""
+
+# Function to gzip data the same way every time (no file name or time stamp), so unchanged files build unchanged
+def gzip_bytes(data):
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+# Function to gzip every asset into piPicoCode/static and write the manifest. Returns [(name, raw size, gzip size)]
+def build():
+    os.makedirs(STATIC_DIR, exist_ok=True)
+    sizes = []
+    lines = [MANIFEST_HEAD]
+    for name, content_type in ASSETS:
+        with open(os.path.join(WEB_DIR, name), "rb") as f:
+            raw = f.read()
+        packed = gzip_bytes(raw)
+        with open(os.path.join(STATIC_DIR, name + ".gz"), "wb") as f:
+            f.write(packed)
+        version = f"{binascii.crc32(raw):08x}"
+        lines.append(f'    b"/static/{name}": ("static/{name}.gz", "{content_type}", {len(packed)}, '
+                     f'"/static/{name}?v={version}"),\n')
+        sizes.append((name, len(raw), len(packed)))
+    lines.append("}\n")
+    with open(os.path.join(PICO_DIR, "static_assets.py"), "w") as f:
+        f.write("".join(lines))
+    return sizes
+
+# Function to count the bytes of the schedule form page as web.py sends it now, rendered on a simulated board
+def form_page_bytes():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import simulator
+    import web
+    controller = simulator.controller
+    controller.board = simulator.SimBoard(simulator.VirtualTimeLoop())
+    controller.log.level = controller.log.ERROR
+    controller.build_calendar(controller.schedule_store.DEFAULT_WINDOWS)
+    return sum(len(chunk) for chunk in web.generate_schedule_form())
+
+def main_cli():
+    sizes = build()
+    print(f"{'file':12} {'raw':>8} {'gzip':>8}")
+    for name, raw, packed in sizes:
+        print(f"{name:12} {raw:8} {packed:8}")
+    raw_total = sum(raw for _, raw, _ in sizes)
+    packed_total = sum(packed for _, _, packed in sizes)
+    page = form_page_bytes()
+    print(f"Form page: {page} bytes per load, was about {page + raw_total} with the CSS and JavaScript inline")
+    print(f"First visit: {page + packed_total} bytes, later visits {page} (the static files are cached)")
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,69 @@
+# Build step for a faster boot: precompiles the Pico code to .mpy
+# MicroPython compiles every .py it imports at boot, which takes time and heap on the Pico. This runs mpy-cross
+# on every module in piPicoCode/ except main.py (the Pico only runs main.py from source) and puts the .mpy files,
+# main.py, schedule.txt and static/ in build/pico/, ready to copy over. mpy-cross has to match the firmware's
+# .mpy version: the one from pip (pip install mpy-cross) works for firmware 1.23 and later.
+# The Pico imports a .py before a .mpy of the same name, so remove the old .py files from it first:
+#
+#   python tools/build_mpy.py
+#   mpremote rm :web.py :controller.py ...    (every old .py on the Pico except main.py)
+#   mpremote cp -r build/pico/. :
+import os
+import shutil
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PICO_DIR = os.path.join(ROOT, "piPicoCode")
+BUILD_DIR = os.path.join(ROOT, "build", "pico")
+
+# Copied as they are: main.py has to stay source, the rest is data
+COPY_FILES = ["main.py", "schedule.txt"]
+COPY_DIRS = ["static"]
+
+# Function to find mpy-cross: the command if it is on the PATH, else the pip package run as a module
+def find_mpy_cross():
+    if shutil.which("mpy-cross"):
+        return ["mpy-cross"]
+    try:
+        import mpy_cross  # noqa: F401
+    except ImportError:
+        return None
+    return [sys.executable, "-m", "mpy_cross"]
+
+def build():
+    mpy_cross = find_mpy_cross()
+    if mpy_cross is None:
+        print("mpy-cross not found, install it with: pip install mpy-cross")
+        return False
+    if os.path.isdir(BUILD_DIR):
+        shutil.rmtree(BUILD_DIR)
+    os.makedirs(BUILD_DIR)
+
+    source_total = mpy_total = 0
+    for name in sorted(os.listdir(PICO_DIR)):
+        if not name.endswith(".py") or name in COPY_FILES:
+            continue
+        source = os.path.join(PICO_DIR, name)
+        target = os.path.join(BUILD_DIR, name[:-3] + ".mpy")
+        result = subprocess.run(mpy_cross + ["-o", target, source], capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"{name}: {result.stderr.strip()}")
+            return False
+        source_size = os.path.getsize(source)
+        mpy_size = os.path.getsize(target)
+        source_total += source_size
+        mpy_total += mpy_size
+        print(f"{name:20} {source_size:7} bytes -> {mpy_size:6} bytes .mpy")
+    print(f"{'total':20} {source_total:7} bytes -> {mpy_total:6} bytes .mpy")
+
+    for name in COPY_FILES:
+        if os.path.exists(os.path.join(PICO_DIR, name)):
+            shutil.copy(os.path.join(PICO_DIR, name), BUILD_DIR)
+    for name in COPY_DIRS:
+        shutil.copytree(os.path.join(PICO_DIR, name), os.path.join(BUILD_DIR, name))
+    print(f"Ready to copy: {BUILD_DIR}")
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if build() else 1)
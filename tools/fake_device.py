@@ -0,0 +1,195 @@
+# Stand-in waterv2 units for trying tools/fleet.py without hardware or a network
+# Each stand-in listens on its own local port and answers the same endpoints as handle_client() in web.py:
+# the form posts (/submit_schedule, /change_time, /instant_test, /cancel_run), the pages (/, /status, /metrics) and
+# the JSON API (/api/schedule, /api/status, /api/history, /api/run). Requests go through the Pico's own request parser and
+# schedule validator, but the pump and the schedule are only bookkeeping. Like the Pico a stand-in handles two
+# requests at a time and answers 503 to the rest. It can add a delay and fail some requests on purpose, to
+# see how the fleet tool copes with slow and flaky units.
+#
+#   python tools/fake_device.py --count 200                       # units on 127.0.0.1:8100 to 8299
+#   python tools/fake_device.py --count 50 --latency 80 --fail-rate 0.1
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+
+PICO_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "piPicoCode")
+sys.path.insert(0, PICO_DIR)
+from request_parser import REQUEST_BUFFER_SIZE, RequestError, read_request, parse_form
+from windows import ALL_DAYS, time_to_minutes, find_conflicts, describe_conflict
+
+# Same as the Pico: two request buffers, so two requests at a time
+REQUEST_BUFFERS = 2
+
+class FakeDevice:
+    def __init__(self, name, latency=0, fail_rate=0, keep_alive=False):
+        self.name = name
+        self.latency = latency / 1000  # seconds added to every answer
+        self.fail_rate = fail_rate  # share of requests that get their connection dropped
+        self.keep_alive = keep_alive  # the Pico closes after every answer, this lets a client reuse the connection
+        self.buffers = [bytearray(REQUEST_BUFFER_SIZE) for _ in range(REQUEST_BUFFERS)]
+        self.windows = []  # (zone, start minute, stop minute, days), like schedule_store.saved_windows
+        self.schedule_version = 1
+        self.clock = "00:00"
+        self.runs = []  # (zone, seconds) queued by tests
+        self.requests = 0
+        self.connections = 0
+        self.server = None
+
+    async def start(self, host, port):
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def handle_client(self, reader, writer):
+        self.connections += 1
+        buf = self.buffers.pop() if self.buffers else None
+        try:
+            if buf is None:
+                writer.write(response("503 Service Unavailable", "text/plain", b"Busy, try again\n"))
+                return
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader, buf), 5.0)
+                except RequestError as e:
+                    writer.write(response(f"{e.status} Error", "text/plain", f"{e}\n".encode()))
+                    return
+                if request is None:
+                    return
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if random.random() < self.fail_rate:
+                    return  # drop the connection without an answer, like a unit dropping off the access point
+                try:
+                    status, content_type, body = self.answer(*request[:3])
+                except ValueError as e:
+                    status, content_type, body = "400 Bad Request", "text/plain", f"{e}\n".encode()
+                writer.write(response(status, content_type, body, self.keep_alive))
+                await writer.drain()
+                if not self.keep_alive:
+                    return
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            if buf is not None:
+                self.buffers.append(buf)
+            writer.close()
+
+    # Function to answer one request. Returns (status, Content-Type, body)
+    def answer(self, method, path, body):
+        if method == b"POST" and path == b"/submit_schedule":
+            fields = parse_form(body)
+            rows = {i: (fields.get(f"start{i}", "NULL"), fields.get(f"stop{i}", "NULL")) for i in range(1, 8)}
+            conflicts = self.save_rows(rows)
+            if conflicts:
+                return "200 OK", "text/html", page("Schedule not accepted: " + "; ".join(conflicts))
+            return "200 OK", "text/html", page("Schedule Submitted Successfully!")
+        if method == b"POST" and path == b"/change_time":
+            new_time = parse_form(body).get("new_time")
+            if new_time:
+                time_to_minutes(new_time)
+                self.clock = new_time
+            return "200 OK", "text/html", self.form_page()
+        if method == b"POST" and path == b"/instant_test":
+            fields = parse_form(body)
+            self.runs.append((int(fields["zone"]), int(fields["runtime"])))
+            return "200 OK", "text/html", self.form_page()
+        if method == b"POST" and path == b"/cancel_run":
+            self.runs.clear()
+            return "200 OK", "text/html", self.form_page()
+        if path == b"/status":
+            return "200 OK", "text/html", page(f"{len(self.runs)} runs queued")
+        if path == b"/metrics":
+            return "200 OK", "text/plain", f"requests {self.requests}\n".encode()
+        if path == b"/api/schedule":
+            if method == b"PUT":
+                data = json.loads(bytes(body))
+                rows = {}
+                for i in range(1, 8):
+                    row = data.get(f"row{i}")
+                    rows[i] = ("NULL", "NULL") if row is None else (row["start"], row["stop"], row.get("days", ALL_DAYS))
+                conflicts = self.save_rows(rows)
+                if conflicts:
+                    return "409 Conflict", "application/json", json.dumps({"conflicts": conflicts}).encode()
+            return "200 OK", "application/json", json.dumps(self.schedule_json()).encode()
+        if path == b"/api/status":
+            runs = [{"state": "queued", "zone": zone, "left": seconds, "kind": "test", "merged": 1, "queued": 0,
+                     "started": None, "finished": None} for zone, seconds in self.runs]
+            return "200 OK", "application/json", json.dumps({"runs": runs}).encode()
+        if path == b"/api/history":
+            totals = {f"zone{zone}": {"today": 0, "week": 0} for zone in range(1, 8)}
+            return "200 OK", "application/json", json.dumps({"runs": [], "totals": totals}).encode()
+        if path == b"/api/run":
+            if method == b"DELETE":
+                self.runs.clear()
+                return "200 OK", "application/json", b'{"cancelled":true}'
+            run = json.loads(bytes(body))
+            self.runs.append((run["zone"], run["seconds"]))
+            return "202 Accepted", "application/json", json.dumps(run).encode()
+        return "200 OK", "text/html", self.form_page()
+
+    # Function to save schedule rows {row: (start, stop[, days])}, the way the Pico does. Returns the conflicts
+    def save_rows(self, rows):
+        windows = []
+        for zone, times in rows.items():
+            if times[0] != "NULL" and times[1] != "NULL":
+                days = times[2] if len(times) > 2 else ALL_DAYS
+                windows.append((zone, time_to_minutes(times[0]), time_to_minutes(times[1]), days))
+        conflicts = find_conflicts(windows)
+        if conflicts:
+            return [describe_conflict(c) for c in conflicts]
+        if windows != self.windows:
+            self.windows = windows
+            self.schedule_version += 1
+        return []
+
+    def schedule_json(self):
+        return {f"row{zone}": {"start": f"{start // 60:02}:{start % 60:02}", "stop": f"{stop // 60:02}:{stop % 60:02}",
+                               "days": days} for zone, start, stop, days in self.windows}
+
+    def form_page(self):
+        return page(f"Set Schedule. Current System Time: {self.clock}")
+
+# Function to build a whole HTTP response
+def response(status, content_type, body, keep_alive=False):
+    return (f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode() + body
+
+def page(text):
+    return f"<!DOCTYPE html>\n<html>\n<body>\n<h1>{text}</h1>\n</body>\n</html>\n".encode()
+
+# Function to start count stand-ins on consecutive ports from base_port (0 for any free ports)
+# Returns [(device, port)]
+async def start_devices(count, host="127.0.0.1", base_port=0, latency=0, fail_rate=0, keep_alive=False):
+    devices = []
+    for i in range(count):
+        device = FakeDevice(f"unit{i + 1}", latency, fail_rate, keep_alive)
+        port = await device.start(host, base_port + i if base_port else 0)
+        devices.append((device, port))
+    return devices
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Run stand-in waterv2 units on local ports")
+    parser.add_argument("--count", type=int, default=10, help="how many units to run")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=8100, help="port of the first unit, the others follow on")
+    parser.add_argument("--latency", type=float, default=0, help="ms added to every answer")
+    parser.add_argument("--fail-rate", type=float, default=0, help="share of requests dropped without an answer")
+    parser.add_argument("--keep-alive", action="store_true", help="keep connections open between requests")
+    args = parser.parse_args()
+
+    async def run():
+        devices = await start_devices(args.count, args.host, args.base_port, args.latency, args.fail_rate,
+                                      args.keep_alive)
+        print(f"{len(devices)} units on {args.host} ports {devices[0][1]} to {devices[-1][1]}, Ctrl-C to stop")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main_cli()
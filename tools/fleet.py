@@ -0,0 +1,256 @@
+# Fleet tool: push a schedule, set the time or collect the status of many waterv2 units at once
+# Talks to every unit over the JSON API and the /change_time form with asyncio, a bounded number of units at a
+# time. A unit's connection is reused for its next request when the unit keeps it open (the Pico closes after
+# every answer, so there it opens a new one). Dropped connections, timeouts and 5xx answers (a busy Pico says 503)
+# are retried with a growing delay. Prints every unit's result and latency, and a summary.
+#
+# Units come from a file with one host or host:port per line, or --local starts stand-ins (see fake_device.py):
+#   python tools/fleet.py --devices units.txt status
+#   python tools/fleet.py --devices units.txt push-schedule piPicoCode/schedule.txt
+#   python tools/fleet.py --devices units.txt set-time            # the time on this computer
+#   python tools/fleet.py --local 300 --fail-rate 0.05 --concurrency 64 push-schedule rows.json
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_device
+from fake_device import PICO_DIR
+sys.path.insert(0, PICO_DIR)
+from schedule_store import parse_schedule_line
+from windows import ALL_DAYS, time_to_minutes
+
+# Answers worth trying again: the unit was busy or something went wrong on it
+RETRY_STATUSES = (500, 502, 503, 504)
+
+class HttpError(Exception):
+    # An answer that isn't a success and isn't worth retrying
+    def __init__(self, status, body):
+        super().__init__(f"HTTP {status}: {body[:200].decode(errors='replace').strip()}")
+        self.status = status
+
+class Unit:
+    # One unit, its open connection (if it keeps connections open) and how the job on it went
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.connection = None  # (reader, writer) kept open by the unit after the last answer
+        self.opened = 0
+        self.reused = 0
+        self.attempts = 0
+        self.latency = []  # seconds each request took, every try counted but not the wait between tries
+        self.result = None
+        self.error = None
+
+    def __str__(self):
+        return f"{self.host}:{self.port}"
+
+    # Function to send one request and read the answer. Returns (status, body)
+    async def request(self, method, path, body=b"", content_type="application/json", timeout=5):
+        if self.connection is None:
+            self.connection = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), timeout)
+            self.opened += 1
+        else:
+            self.reused += 1
+        reader, writer = self.connection
+        try:
+            writer.write((f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: {content_type}\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n").encode() + body)
+            await writer.drain()
+            status, keep_alive, answer = await asyncio.wait_for(read_response(reader), timeout)
+        except BaseException:
+            self.close()
+            raise
+        if not keep_alive:
+            self.close()
+        return status, answer
+
+    def close(self):
+        if self.connection is not None:
+            self.connection[1].close()
+            self.connection = None
+
+# Function to read an HTTP response. Returns (status, whether the connection stays open, body)
+# The Pico ends its header lines with \r\n or just \n depending on the page, so both are taken
+async def read_response(reader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionResetError("connection closed without an answer")
+    parts = line.split()
+    if len(parts) < 2 or not parts[1].isdigit():
+        raise ConnectionResetError(f"bad status line {line[:80]!r}")
+    status = int(parts[1])
+    length = None
+    keep_alive = False
+    while True:
+        line = (await reader.readline()).strip()
+        if not line:
+            break
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            length = int(value)
+        elif name == b"connection":
+            keep_alive = value.strip().lower() == b"keep-alive"
+    if length is None:
+        return status, False, await reader.read()  # no length, the body runs to the end of the connection
+    return status, keep_alive, await reader.readexactly(length)
+
+# Function to send a request to a unit, trying again on dropped connections, timeouts and 5xx answers
+# Returns the body of the answer, raises the last error once the retries are used up
+async def call(unit, method, path, body=b"", content_type="application/json", retries=3, timeout=5):
+    for attempt in range(retries + 1):
+        unit.attempts += 1
+        began = time.perf_counter()
+        try:
+            status, answer = await unit.request(method, path, body, content_type, timeout)
+            if status in RETRY_STATUSES:
+                raise ConnectionResetError(f"HTTP {status}")
+            if status >= 400:
+                raise HttpError(status, answer)
+            return answer
+        except (OSError, EOFError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            if attempt == retries:
+                raise
+        finally:
+            unit.latency.append(time.perf_counter() - began)
+        # Back off a little more every time, with some jitter so the units that failed together don't retry together
+        await asyncio.sleep(0.1 * 2 ** attempt * (0.5 + random.random()))
+
+# Jobs, one function each taking a unit and the parsed arguments. What they return is the unit's result
+
+async def job_status(unit, args):
+    status = json.loads(await call(unit, "GET", "/api/status", retries=args.retries, timeout=args.timeout))
+    schedule = json.loads(await call(unit, "GET", "/api/schedule", retries=args.retries, timeout=args.timeout))
+    running = [run["zone"] for run in status["runs"] if run["state"] == "running"]
+    queued = sum(1 for run in status["runs"] if run["state"] == "queued")
+    return f"{len(schedule)} rows, running {running[0] if running else 'nothing'}, {queued} queued"
+
+async def job_push_schedule(unit, args):
+    answer = json.loads(await call(unit, "PUT", "/api/schedule", args.rows, retries=args.retries, timeout=args.timeout))
+    if answer != saved_rows(json.loads(args.rows)):
+        raise ValueError("the unit saved a different schedule")
+    return f"{len(answer)} rows saved"
+
+async def job_set_time(unit, args):
+    # Taken for every unit as it is reached, so units late in a big fleet don't get a stale time
+    new_time = args.time or time.strftime("%H:%M")
+    await call(unit, "POST", "/change_time", f"new_time={new_time.replace(':', '%3A')}".encode(),
+               "application/x-www-form-urlencoded", args.retries, args.timeout)
+    return f"time set to {new_time}"
+
+# Function to work out the rows a unit echoes back after saving rows: only row1 to row7, each with its days
+# (every day when left out) and its times as HH:MM
+def saved_rows(rows):
+    saved = {}
+    for i in range(1, 8):
+        row = rows.get(f"row{i}")
+        if row is not None:
+            start = time_to_minutes(row["start"])
+            stop = time_to_minutes(row["stop"])
+            saved[f"row{i}"] = {"start": f"{start // 60:02}:{start % 60:02}", "stop": f"{stop // 60:02}:{stop % 60:02}",
+                                "days": row.get("days", ALL_DAYS)}
+    return saved
+
+JOBS = {"status": job_status, "push-schedule": job_push_schedule, "set-time": job_set_time}
+
+# Function to load a schedule as the JSON rows /api/schedule takes, from a rows .json file or a schedule.txt file
+def load_rows(path):
+    with open(path) as f:
+        if path.endswith(".json"):
+            rows = json.load(f)
+        else:
+            rows = {}
+            for line in f:
+                parsed = parse_schedule_line(line)
+                if parsed and f"row{parsed[0]}" not in rows:  # like the form, one window per row
+                    row, start_hour, start_minute, stop_hour, stop_minute, duration, days = parsed
+                    rows[f"row{row}"] = {"start": f"{start_hour:02}:{start_minute:02}",
+                                         "stop": f"{stop_hour:02}:{stop_minute:02}", "days": days}
+    return json.dumps(rows, separators=(",", ":")).encode()
+
+# Function to read a units file: one host or host:port per line, # starts a comment
+def load_units(path):
+    units = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#")[0].strip()
+            if line:
+                host, _, port = line.partition(":")
+                units.append(Unit(host, int(port or 80)))
+    return units
+
+# Function to run job on every unit, at most concurrency units at a time
+async def run_fleet(units, job, args, concurrency):
+    gate = asyncio.Semaphore(concurrency)
+
+    async def run_one(unit):
+        async with gate:
+            try:
+                unit.result = await job(unit, args)
+            except Exception as e:
+                unit.error = e
+            finally:
+                unit.close()
+
+    await asyncio.gather(*(run_one(unit) for unit in units))
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)] if values else 0
+
+def report(units, elapsed, verbose):
+    for unit in units:
+        if verbose or unit.error is not None:
+            outcome = unit.result if unit.error is None else f"FAILED {unit.error}"
+            print(f"{str(unit):22} {sum(unit.latency) * 1000:8.1f} ms  {unit.attempts} tries  {outcome}")
+    ok = sum(1 for unit in units if unit.error is None)
+    latencies = [sum(unit.latency) * 1000 for unit in units]
+    requests = sum(unit.attempts for unit in units)
+    print(f"{ok} of {len(units)} units ok in {elapsed:.2f} s, {requests} requests ({requests / elapsed:.0f}/s)")
+    print(f"Latency per unit: p50 {percentile(latencies, 0.5):.1f} ms, p95 {percentile(latencies, 0.95):.1f} ms, "
+          f"max {max(latencies, default=0):.1f} ms")
+    print(f"Connections: {sum(unit.opened for unit in units)} opened, {sum(unit.reused for unit in units)} reused")
+    return ok == len(units)
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Push schedules, set the time or collect status on many waterv2 units")
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument("--devices", help="file with one host or host:port per line")
+    where.add_argument("--local", type=int, metavar="N", help="start N stand-in units here (see fake_device.py)")
+    parser.add_argument("--concurrency", type=int, default=32, help="units worked on at once")
+    parser.add_argument("--retries", type=int, default=3, help="tries after the first for a failed request")
+    parser.add_argument("--timeout", type=float, default=5, help="seconds to wait for a connection or an answer")
+    parser.add_argument("--verbose", action="store_true", help="print every unit, not just the failed ones")
+    parser.add_argument("--latency", type=float, default=0, help="--local: ms the stand-ins add to every answer")
+    parser.add_argument("--fail-rate", type=float, default=0, help="--local: share of requests the stand-ins drop")
+    parser.add_argument("--keep-alive", action="store_true", help="--local: stand-ins keep connections open")
+    jobs = parser.add_subparsers(dest="job", required=True)
+    jobs.add_parser("status", help="running and queued runs and the schedule of every unit")
+    push = jobs.add_parser("push-schedule", help="save a schedule on every unit")
+    push.add_argument("schedule", help="schedule.txt style file, or a .json file of rows as /api/schedule takes")
+    set_time = jobs.add_parser("set-time", help="set the clock of every unit")
+    set_time.add_argument("time", nargs="?", help="HH:MM, the time on this computer if left out")
+    args = parser.parse_args()
+    if args.job == "push-schedule":
+        args.rows = load_rows(args.schedule)
+
+    async def run():
+        if args.local:
+            devices = await fake_device.start_devices(args.local, latency=args.latency, fail_rate=args.fail_rate,
+                                                      keep_alive=args.keep_alive)
+            units = [Unit("127.0.0.1", port) for _, port in devices]
+        else:
+            units = load_units(args.devices)
+        began = time.perf_counter()
+        await run_fleet(units, JOBS[args.job], args, args.concurrency)
+        return report(units, time.perf_counter() - began, args.verbose)
+
+    sys.exit(0 if asyncio.run(run()) else 1)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,335 @@
+# Host simulator for the Pico code
+# Runs the Pico code (piPicoCode/controller.py) on CPython against a simulated board (pump, zone selector, clock, access point)
+# and an asyncio event loop on virtual time, so days or a year of scheduled watering replay in seconds
+#
+#   python tools/simulator.py --days 365
+#   python tools/simulator.py --days 7 --schedule my_schedule.txt --events
+#   python tools/simulator.py --days 30 --profile
+import argparse
+import asyncio
+import calendar
+import contextlib
+import importlib
+import io
+import os
+import selectors
+import sys
+import tempfile
+import time
+
+PICO_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "piPicoCode")
+sys.path.insert(0, PICO_DIR)
+# Three zones, one on some weekdays only and one across midnight. piPicoCode/schedule.txt only has empty windows
+SAMPLE_SCHEDULE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_schedule.txt")
+import duty_cycle
+import controller
+import hal
+import power
+import run_history
+
+# Monday 17 March 2025, 00:00
+START_TIME = calendar.timegm((2025, 3, 17, 0, 0, 0))
+
+class VirtualSelector:
+    # Wraps a real selector so the event loop never blocks: instead of waiting for the next timer
+    # it moves virtual time forward to it
+    def __init__(self, loop):
+        self.selector = selectors.DefaultSelector()
+        self.loop = loop
+
+    def select(self, timeout=None):
+        events = self.selector.select(0)
+        if not events:
+            if timeout is None:
+                raise RuntimeError("simulation stalled: nothing is waiting on a timer")
+            self.loop.virtual_time += timeout
+        # The loop runs timers due within its clock resolution early. Move the clock up to them, or a task waiting
+        # for the wall clock to reach a deadline would wake, find it not there yet and wait again, forever
+        scheduled = self.loop._scheduled
+        if scheduled:
+            self.loop.virtual_time = max(self.loop.virtual_time, min(scheduled[0].when(),
+                                                                     self.loop.virtual_time + self.loop._clock_resolution))
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    # asyncio event loop whose clock is virtual, so asyncio.sleep() takes no real time
+    def __init__(self):
+        self.virtual_time = 0.0
+        super().__init__(VirtualSelector(self))
+        # Timers due within this much of now count as due. The default (1 ns) gets lost in float
+        # rounding once virtual time reaches months, and the loop would spin on a timer that never fires
+        self._clock_resolution = 0.001
+
+    def time(self):
+        return self.virtual_time
+
+class SimClock:
+    # Wall clock on top of the loop's virtual time, starting at START_TIME (UTC, so no time zone surprises)
+    def __init__(self, loop, start=START_TIME):
+        self.loop = loop
+        self.offset = start
+
+    def time(self):
+        return self.offset + self.loop.time()
+
+    def ticks_ms(self):
+        return int(self.loop.time() * 1000)
+
+    def localtime(self, t=None):
+        return time.gmtime(self.time() if t is None else t)
+
+    def set_time(self, hours, minutes):
+        # Same fixed date as the Pico's set_time
+        self.offset = calendar.timegm((2025, 3, 18, hours, minutes, 0)) - self.loop.time()
+
+class SimPump:
+    # Records every switch of the pump and adds up how long it ran on each zone
+    # Keeps its own heat model to check the pump never goes over its thermal budget (see duty_cycle.py)
+    def __init__(self, board):
+        self.board = board
+        self.running_since = None
+        self.zone = 0
+        self.on_seconds = {}  # zone -> seconds pumped
+        self.runs = []  # (start time, zone, seconds) for every time the pump was switched on
+        self.heat = duty_cycle.PumpBudget()
+        self.peak_heat = 0
+
+    def on(self):
+        assert not self.board.selector.is_moving(), "pump switched on while the selector arm is still moving"
+        if self.running_since is None:
+            self.running_since = self.board.clock.time()
+            self.on_ticks = self.board.clock.ticks_ms()
+            self.heat.switch(True, self.on_ticks)
+            self.zone = self.board.selector.position
+            self.board.record("pump on", self.zone)
+
+    def off(self):
+        if self.running_since is not None:
+            now = self.board.clock.ticks_ms()
+            seconds = (now - self.on_ticks) / 1000
+            self.heat.switch(False, now)
+            self.peak_heat = max(self.peak_heat, self.heat.heat)
+            assert self.heat.heat <= self.heat.limit + 0.01, f"pump over its thermal budget at {format_time(self.board.clock.time())}"
+            self.on_seconds[self.zone] = self.on_seconds.get(self.zone, 0) + seconds
+            self.runs.append((self.running_since, self.zone, seconds))
+            self.running_since = None
+            self.board.record("pump off", self.zone)
+
+    def release(self):
+        assert self.running_since is None, "pump released while running"
+
+class SimSelector:
+    # Records where the selector arm is sent and how long it spends travelling
+    # Follows the arm on its own: it sweeps at a steady speed from wherever it is when it is sent off, also when a
+    # move is cut short, then settles. move_to tells the Pico code the same wait hal.PicoSelector would, so the
+    # pump's check that the arm has stopped catches the code starting the pump before the arm really got there
+    def __init__(self, board):
+        self.board = board
+        self.position = None  # zone the arm was last sent to
+        self.moves = 0
+        self.travel_seconds = 0
+        self.told_arrives = 0  # ticks the Pico code was told the arm gets there
+        self.from_ns = None  # servo pulse width the arm set off from
+        self.to_ns = None  # and is going to, None before the first move
+        self.set_off = 0
+        self.arrives = 0  # ticks the arm really gets there and has settled
+
+    # Where the arm is at ticks now, as a servo pulse width
+    def arm_at(self, now):
+        moved = (now - self.set_off) / 1000 / hal.SELECTOR_FULL_SWEEP_SECONDS * (hal.ZONE_NS[-1] - hal.ZONE_NS[0])
+        if self.to_ns > self.from_ns:
+            return min(self.from_ns + moved, self.to_ns)
+        return max(self.from_ns - moved, self.to_ns)
+
+    def move_to(self, zone):
+        now = self.board.clock.ticks_ms()
+        travel = hal.selector_wait_time(self.position, zone, (self.told_arrives - now) / 1000)
+        if zone != self.position:
+            assert self.board.pump.running_since is None, "selector moved while the pump is running"
+            self.moves += 1
+            self.travel_seconds += hal.selector_travel_time(self.position, zone)
+            self.board.record("selector", zone)
+        self.position = zone
+        self.told_arrives = now + travel * 1000
+
+        target = hal.ZONE_NS[zone]
+        if self.to_ns is None:
+            # Where the arm was at power up isn't known, so take the worst: the far end from the first zone
+            at = hal.ZONE_NS[0] if hal.ZONE_NS[-1] - target < target - hal.ZONE_NS[0] else hal.ZONE_NS[-1]
+        else:
+            at = self.arm_at(now)
+        if at == target:
+            arrives = max(self.arrives, now)  # there already, or still settling
+        else:
+            arrives = now + (hal.SELECTOR_FULL_SWEEP_SECONDS * abs(target - at) / (hal.ZONE_NS[-1] - hal.ZONE_NS[0])
+                             + hal.SELECTOR_SETTLE_SECONDS) * 1000
+        self.from_ns, self.to_ns, self.set_off, self.arrives = at, target, now, arrives
+        return travel
+
+    def is_moving(self):
+        return self.board.clock.ticks_ms() < self.arrives - 1
+
+    def release(self):
+        pass
+
+class SimAccessPoint:
+    def start(self, ssid, password):
+        self.ssid = ssid
+
+    def active(self):
+        return True
+
+    def ifconfig(self):
+        return ("192.168.4.1", "255.255.255.0", "192.168.4.1", "0.0.0.0")
+
+class SimPower:
+    # Records the CPU clock and the light sleeps. A light sleep stops the event loop and jumps the virtual clock
+    # forward, the way the Pico stops for the time it sleeps
+    def __init__(self, board):
+        self.board = board
+        self.low_clock = False
+        self.sleeps = 0
+        self.slept_ms = 0
+
+    def set_low_clock(self, low):
+        self.low_clock = low
+
+    def lightsleep(self, ms):
+        self.sleeps += 1
+        self.slept_ms += ms
+        loop = getattr(self.board.clock, "loop", None)
+        if isinstance(loop, VirtualTimeLoop):
+            loop.virtual_time += ms / 1000
+        else:
+            time.sleep(ms / 1000)
+
+class SimBoard:
+    # Same interface as hal.PicoBoard. Keeps an event log of (time, what, zone)
+    def __init__(self, loop, start=START_TIME, keep_events=False):
+        self.clock = SimClock(loop, start)
+        self.selector = SimSelector(self)
+        self.pump = SimPump(self)
+        self.ap = SimAccessPoint()
+        self.power = SimPower(self)
+        self.keep_events = keep_events
+        self.events = []
+
+    def record(self, what, zone):
+        if self.keep_events:
+            self.events.append((self.clock.time(), what, zone))
+
+# Function to run the controller (schedule + zone runner, no web server) for a number of simulated days
+# schedule_file is a schedule.txt style file, migrated into schedule.bin the same way the Pico does on first boot
+# low_power runs power.power_saver next to the controller, in light sleep mode
+# Returns the SimBoard, with everything the pump and selector did
+def simulate(days, schedule_file=None, keep_events=False, quiet=True, low_power=False):
+    global controller, power, run_history
+    workdir = tempfile.TemporaryDirectory(prefix="waterv2-sim-")
+    old_cwd = os.getcwd()
+    if schedule_file:
+        schedule_file = os.path.abspath(schedule_file)
+    os.chdir(workdir.name)
+    loop = VirtualTimeLoop()
+    asyncio.set_event_loop(loop)
+    try:
+        if schedule_file:
+            with open(schedule_file) as src, open("schedule.txt", "w") as dst:
+                dst.write(src.read())
+        run_history = importlib.reload(run_history)  # fresh module state for every simulation
+        controller = importlib.reload(controller)
+        power = importlib.reload(power)
+        board = SimBoard(loop, keep_events=keep_events)
+        controller.board = board
+
+        async def run():
+            controller.start_controller()
+            if low_power:
+                asyncio.create_task(power.power_saver(power.MODE_LIGHTSLEEP))
+            await asyncio.sleep(days * 86400)
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output if quiet else sys.stdout):
+            loop.run_until_complete(run())
+            # stop watering and then the controller tasks, so nothing outlives the loop
+            loop.run_until_complete(controller.cancel_zone_run())
+            loop.run_until_complete(asyncio.sleep(5))
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        return board
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+        os.chdir(old_cwd)
+        workdir.cleanup()
+
+def format_time(t):
+    return time.strftime("%a %Y-%m-%d %H:%M:%S", time.gmtime(t))
+
+def report(board, days, elapsed):
+    print(f"Simulated {days} days in {elapsed:.2f} s ({days * 86400 / elapsed:,.0f}x real time)")
+    print(f"Pump runs: {len(board.pump.runs)}, selector moves: {board.selector.moves}, "
+          f"selector travel: {board.selector.travel_seconds:.0f} s ({board.selector.travel_seconds / days:.1f} s per day)")
+    print(f"Pump heat peak: {board.pump.peak_heat:.1f} of {board.pump.heat.limit} (duty {board.pump.heat.duty:.0%})")
+    for zone in sorted(board.pump.on_seconds):
+        seconds = board.pump.on_seconds[zone]
+        print(f"  zone {zone}: {seconds / 60:9.1f} pump minutes, {seconds / 60 / days:6.1f} per day")
+
+# Function to report the low-power idle run and check it watered the same as a run that stays awake
+# Returns True if it did
+def check_low_power(board, days, schedule_file):
+    spent = power.totals()
+    total = sum(spent)
+    print(f"Low-power idle: asleep {spent[power.ASLEEP] * 100 / total:.1f}% of the time in {power.sleeps} sleeps, "
+          f"about {power.estimate_mah_per_day(spent):.0f} mAh per day against {power.CURRENT_MA[power.AWAKE] * 24} awake")
+    awake = simulate(days, schedule_file)
+    if not awake.pump.runs:
+        print("FAILED: the schedule never ran the pump, nothing to compare (give a --schedule with some windows)")
+        return False
+    if len(awake.pump.runs) != len(board.pump.runs):
+        print(f"FAILED: {len(board.pump.runs)} pump runs with low-power idle, {len(awake.pump.runs)} without")
+        return False
+    for (start, zone, seconds), (awake_start, awake_zone, awake_seconds) in zip(board.pump.runs, awake.pump.runs):
+        if zone != awake_zone or abs(start - awake_start) > 1 or abs(seconds - awake_seconds) > 1:
+            print(f"FAILED: zone {zone} run at {format_time(start)} for {seconds:.0f} s with low-power idle, "
+                  f"zone {awake_zone} at {format_time(awake_start)} for {awake_seconds:.0f} s without")
+            return False
+    print(f"Same {len(board.pump.runs)} pump runs as without low-power idle, all within 1 s")
+    return True
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Replay the waterv2 schedule on a virtual clock")
+    parser.add_argument("--days", type=float, default=7, help="simulated days to run")
+    parser.add_argument("--schedule", default=SAMPLE_SCHEDULE,
+                        help="schedule.txt style file to load, tools/sample_schedule.txt if not given")
+    parser.add_argument("--events", action="store_true", help="print every pump and selector event")
+    parser.add_argument("--verbose", action="store_true", help="show what the Pico code prints")
+    parser.add_argument("--profile", action="store_true", help="profile the run with cProfile")
+    parser.add_argument("--low-power", action="store_true",
+                        help="run with low-power idle and check it waters the same as without")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.profile:
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        board = profiler.runcall(simulate, args.days, args.schedule, args.events, not args.verbose)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+    else:
+        board = simulate(args.days, args.schedule, args.events, not args.verbose, args.low_power)
+    elapsed = time.perf_counter() - started
+
+    if args.events:
+        for t, what, zone in board.events:
+            print(f"{format_time(t)}  {what:9} zone {zone}")
+    report(board, args.days, elapsed)
+    if args.low_power and not check_low_power(board, args.days, args.schedule):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main_cli()
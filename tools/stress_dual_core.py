@@ -0,0 +1,175 @@
+# Stress test for the dual-core mode of the Pico code (controller.core1_worker)
+# Runs core1_worker in a real thread against a simulated board on a sped up clock, while the real web server
+# handler takes a flood of concurrent requests on the main thread: instant tests, cancels, schedule submits,
+# clock changes, status and metrics pages. Fails if anything goes wrong:
+#   - core 1 raises, or anything but core 1 touches the pump or selector
+#   - the pump runs while the selector arm moves, or over its thermal budget (checked by the simulated board)
+#   - a command posted to the mailbox never reaches core 1, or a request gets an unexpected answer
+#   - the pump is left on at the end
+#
+#   python tools/stress_dual_core.py
+#   python tools/stress_dual_core.py --seconds 60 --clients 16 --speed 200
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simulator
+from simulator import START_TIME, SimBoard, format_time
+
+import web
+controller = simulator.controller
+
+class FastClock:
+    # Real time sped up speed times, so pump pulses and schedule windows come round quickly
+    def __init__(self, speed, start=START_TIME):
+        self.speed = speed
+        self.began = time.monotonic()
+        self.offset = start
+
+    def elapsed(self):
+        return (time.monotonic() - self.began) * self.speed
+
+    def time(self):
+        return self.offset + self.elapsed()
+
+    def ticks_ms(self):
+        return int(self.elapsed() * 1000)
+
+    def sleep_ms(self, ms):
+        time.sleep(ms / 1000 / self.speed)
+
+    def localtime(self, t=None):
+        return time.gmtime(self.time() if t is None else t)
+
+    def set_time(self, hours, minutes):
+        self.offset = simulator.calendar.timegm((2025, 3, 18, hours, minutes, 0)) - self.elapsed()
+
+# Function to make the board's pump and selector fail when any thread but core 1 uses them
+def guard_hardware(board, core1):
+    for part, names in ((board.pump, ("on", "off")), (board.selector, ("move_to",))):
+        for name in names:
+            method = getattr(part, name)
+
+            def guarded(*args, method=method, name=name):
+                assert threading.get_ident() == core1[0], f"{name} called outside core 1"
+                return method(*args)
+            setattr(part, name, guarded)
+
+FORMS = [
+    (b"/instant_test", lambda: f"zone={random.randint(1, 7)}&runtime={random.randint(5, 90)}"),
+    (b"/cancel_run", lambda: "cancel_run="),
+    (b"/change_time", lambda: f"new_time={random.randint(0, 23):02}%3A{random.randint(0, 59):02}"),
+    (b"/submit_schedule", lambda: "&".join(f"start{i}={i + 5:02}%3A00&stop{i}={i + 5:02}%3A{random.randint(10, 50)}"
+                                           for i in range(1, 8))),
+]
+
+async def client(port, deadline, stats):
+    while time.monotonic() < deadline:
+        roll = random.random()
+        if roll < 0.6:
+            path, body = FORMS[0][0], FORMS[0][1]()
+        elif roll < 0.7:
+            path, body = FORMS[1][0], FORMS[1][1]()
+        elif roll < 0.75:
+            path, body = FORMS[2][0], FORMS[2][1]()
+        elif roll < 0.8:
+            path, body = FORMS[3][0], FORMS[3][1]()
+        else:
+            path, body = random.choice((b"/status", b"/metrics", b"/", b"/api/status", b"/api/schedule", b"/api/history")), None
+        if body is None:
+            request = b"GET " + path + b" HTTP/1.1\r\nHost: pico\r\n\r\n"
+        else:
+            request = (b"POST " + path + b" HTTP/1.1\r\nHost: pico\r\nContent-Length: " + str(len(body)).encode() +
+                       b"\r\n\r\n" + body.encode())
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            writer.write(request)
+            await writer.drain()
+            status = (await reader.read())[9:12].decode()
+        except ConnectionResetError:
+            status = "reset"  # the connection was closed under the request, the server should never do that
+        writer.close()
+        stats[status] = stats.get(status, 0) + 1
+        await asyncio.sleep(random.random() * 0.01)
+
+# Run it in an empty directory, for the schedule and history files (see main_cli)
+def stress(seconds, clients, speed):
+    board = SimBoard(None, keep_events=False)
+    board.clock = FastClock(speed)
+    controller.board = board
+    core1 = [None]
+    guard_hardware(board, core1)
+    errors = []
+
+    started = threading.Event()
+    done = threading.Event()
+    real_start_new_thread = controller._thread.start_new_thread
+
+    def worker():
+        core1[0] = threading.get_ident()
+        started.set()
+        try:
+            controller.core1_worker()
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    async def run():
+        controller._thread.start_new_thread = lambda function, args: real_start_new_thread(worker, ())
+        try:
+            controller.start_controller(dual_core=True)
+        finally:
+            controller._thread.start_new_thread = real_start_new_thread
+        started.wait()
+        server = await asyncio.start_server(web.handle_client, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        stats = {}
+        deadline = time.monotonic() + seconds
+        await asyncio.gather(*(client(port, deadline, stats) for _ in range(clients)))
+        server.close()
+        return stats
+
+    controller.log.level = controller.log.ERROR
+    stats = asyncio.run(run())
+    controller.mailbox.post(controller.CMD_STOP, wait=True)
+    if not done.wait(10):
+        errors.append(RuntimeError("core 1 did not stop"))
+
+    print(f"{sum(stats.values())} requests from {clients} clients in {seconds} s, answers: {stats}")
+    print(f"Mailbox: {controller.mailbox.posted} commands posted, {controller.mailbox.taken} taken")
+    print(f"Pump runs: {len(board.pump.runs)}, selector moves: {board.selector.moves}, "
+          f"pump heat peak {board.pump.peak_heat:.1f} of {board.pump.heat.limit}, "
+          f"simulated time {format_time(board.clock.time())}")
+    if controller.mailbox.posted != controller.mailbox.taken:
+        errors.append(RuntimeError("commands were left in the mailbox"))
+    if board.pump.running_since is not None:
+        errors.append(RuntimeError("pump left on"))
+    unexpected = {status: n for status, n in stats.items() if status not in ("200", "503")}
+    if unexpected:
+        errors.append(RuntimeError(f"unexpected answers {unexpected}"))
+    for error in errors:
+        print("FAILED:", repr(error))
+    return not errors
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Stress the dual-core mode with concurrent requests")
+    parser.add_argument("--seconds", type=float, default=10, help="real seconds to run for")
+    parser.add_argument("--clients", type=int, default=8, help="clients sending requests at once")
+    parser.add_argument("--speed", type=float, default=100, help="how many times faster than real time the board clock runs")
+    args = parser.parse_args()
+    old_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="waterv2-stress-") as workdir:
+        os.chdir(workdir)
+        ok = stress(args.seconds, args.clients, args.speed)
+        os.chdir(old_cwd)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,45 @@
+// Function to validate the form based on which button was clicked
+function validateForm(event) {
+    // Prevent form submission to handle validation first
+    event.preventDefault();
+
+    // Get the name of the button clicked
+    let action = event.submitter.name;
+
+    let valid = true;
+
+    // Handle "Set Time" button validation
+    if (action === 'change_time') {
+        const timeInput = document.querySelector('[name="new_time"]');
+        if (!timeInput.value) {
+            alert('Please set the system time.');
+            valid = false;
+        }
+    }
+
+    // Handle "Submit Schedule" button validation
+    if (action === 'submit_schedule') {
+        const startInputs = document.querySelectorAll('input[name^="start"]');
+        const stopInputs = document.querySelectorAll('input[name^="stop"]');
+        startInputs.forEach((input, index) => {
+            if (!input.value || !stopInputs[index].value) {
+                alert('Please fill in all schedule times.');
+                valid = false;
+            }
+        });
+    }
+
+    // Handle "Instant Test" button validation
+    if (action === 'instant_test') {
+        const runtimeInput = document.querySelector('[name="runtime"]');
+        if (!runtimeInput.value) {
+            alert('Please enter the run time.');
+            valid = false;
+        }
+    }
+
+    // If the form is valid, submit it
+    if (valid) {
+        event.target.submit();
+    }
+}